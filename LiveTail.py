@@ -0,0 +1,98 @@
+import copy
+import pandas as pd
+import helpers as hl
+from LogSource import LogSource
+
+REORDER_WINDOW = pd.Timedelta(minutes=max(hl.RATE_WINDOWS)) # QSOs this close to the last one may still change
+
+def same_qsos(a, b) -> bool:
+    """Frames hold the same qsos, whatever categories their columns were read with"""
+    return len(a) == len(b) and (len(a) == 0 or bool((pd.util.hash_pandas_object(a).to_numpy() ==
+                                                      pd.util.hash_pandas_object(b).to_numpy()).all()))
+
+class LiveTail:
+    """Follows one contest of a database the logger keeps appending to.
+
+    Each poll reads only the DXLOG rows past the rowid high-water mark and
+    those of the last REORDER_WINDOW, so the cost of a refresh depends on the
+    new and recent QSOs only. QSOs older than the window are folded into the
+    stats and performance accumulators; the recent ones are read again every
+    poll, so QSOs another station logs slightly out of TS order, edits and
+    deletions within the window are picked up without reloading the contest.
+    Only a new QSO older than the window starts over."""
+    def __init__(self, source: LogSource, contest_id: int, increment: int = 1, increment_unit: str = 'hours'):
+        self.source_ = source
+        self.contest_id_ = contest_id
+        self.increment_ = increment
+        self.increment_unit_ = increment_unit
+        info = source.get_contest_info(contest_id)
+        self.min_off_ = hl.min_off_time(info.ContestName.iloc[0] if len(info) else '')
+        self.reset()
+
+    def reset(self):
+        self.last_rowid_ = 0
+        self.settled_ts_ = None # QSOs before it are folded into the accumulators
+        self.recent_ = pd.DataFrame() # QSOs since settled_ts_ with their rowid, read again every poll
+        self.stats_ = hl.StatsAccumulator(break_time=self.min_off_)
+        self.performance_ = hl.PerformanceAccumulator(self.increment_, self.increment_unit_)
+        self.current_ = None # accumulators with the recent QSOs added, see current
+
+    def poll(self) -> int:
+        """Fetch qsos logged or changed since the previous poll, return the number of new ones
+        (1 when only recent ones changed)"""
+        since = self.last_rowid_ if len(self.recent_) == 0 else min(self.last_rowid_, int(self.recent_.rowid.min()) - 1)
+        df, last_rowid = self.source_.get_qsos_since(self.contest_id_, since, hl.QSO_COLUMNS)
+        new = df[df.rowid > self.last_rowid_] if len(df) else df
+        if len(df):
+            df = df.sort_index(kind='stable')
+        if self.settled_ts_ is not None and len(df):
+            old = df.index < self.settled_ts_
+            if (old & (df.rowid.isin(self.recent_.rowid) | (df.rowid > self.last_rowid_)).to_numpy()).any():
+                # a qso was logged or moved before the window, start over from the beginning
+                hl.log('INFO', f'Out of order qso in contest {self.contest_id_}, reloading')
+                self.reset()
+                return self.poll()
+            df = df[~old] # folded already
+        changed = len(new) > 0 or not same_qsos(df, self.recent_)
+        self.last_rowid_ = max(self.last_rowid_, last_rowid)
+        if not changed:
+            return 0
+        self.current_ = None
+        self.recent_ = df
+        if len(df):
+            settled_ts = df.index[-1] - REORDER_WINDOW
+            if self.settled_ts_ is not None:
+                settled_ts = max(settled_ts, self.settled_ts_)
+            settled = df.index < settled_ts
+            self.fold(self.stats_, self.performance_, df[settled])
+            self.recent_ = df[~settled]
+            self.settled_ts_ = settled_ts
+        return max(len(new), 1)
+
+    @staticmethod
+    def fold(stats, performance, df):
+        if len(df) == 0:
+            return
+        df = df.drop(columns='rowid')
+        stats.update(df)
+        performance.update(df)
+
+    def current(self) -> tuple:
+        """(stats, performance) accumulators of all QSOs: copies of the settled ones with the recent ones added"""
+        if self.current_ is None:
+            stats, performance = copy.deepcopy((self.stats_, self.performance_))
+            self.fold(stats, performance, self.recent_)
+            self.current_ = (stats, performance)
+        return self.current_
+
+    def stats(self) -> dict:
+        return self.current()[0].stats()
+
+    def performance(self) -> dict:
+        return self.current()[1].data()
+
+    def breaks(self):
+        return self.current()[0].off_time_frame()
+
+    def mults(self) -> dict:
+        return self.current()[0].entities_.result()
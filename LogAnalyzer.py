@@ -1,7 +1,9 @@
 import tkinter as tk
 from tkinter import ttk, filedialog
 import shelve
+import multiprocessing
 import os
+import sqlite3
 import sys
 from datetime import datetime
 import platform
@@ -11,8 +13,35 @@ if platform.system() == 'Darwin':
 else:
     Button = tk.Button
     gLeftButton = '<ButtonRelease-3>'
-import helpers as hl
-from LogSource import LogSource, SQLLogSource
+import instrument
+from VirtualTable import VirtualTable
+from lazy import lazy_import
+# the analysis modules import pandas, they are loaded once the window is shown
+hl = lazy_import('helpers')
+sources = lazy_import('LogSource')
+cabrillo = lazy_import('cabrillo')
+caches = lazy_import('StatsCache')
+live = lazy_import('LiveTail')
+workers = lazy_import('Workers')
+scp = lazy_import('scp')
+compare = lazy_import('compare')
+
+# log tree column: (summary index column, heading)
+SUMMARY_TREE_COLUMNS = {'qsos': ('QSOs', 'QSOs'), 'score': ('Score', 'Score'),
+                        'hours': ('Hours', 'Hours'), 'rate': ('Rate60', '60m Rate')}
+
+def summary_value(summary_col, value):
+    """Log tree value of a summary index column, blank when not known"""
+    if value is None or value != value:
+        return ''
+    if summary_col == 'Hours':
+        return f'{value:.1f}'
+    return int(value)
+
+def summary_values(summary):
+    """Log tree values of a summary index row"""
+    return tuple(summary_value(summary_col, summary.get(summary_col))
+                 for summary_col, _ in SUMMARY_TREE_COLUMNS.values())
 
 class LogAnalyzerApp:
     def __init__(self, root, config_path, data_path):
@@ -27,16 +56,192 @@ class LogAnalyzerApp:
         self.root_.protocol("WM_DELETE_WINDOW", self.quit_app)
         self.root_.createcommand("::tk::mac::Quit", self.quit_app)
         self.root_.title("Log Analyzer: knowledge weapon of winners")
-        self.log_source_ : LogSource
+        self.log_source_ = None # LogSource, opened after the window is shown
+        self.stats_caches_ = {} # database file: StatsCache
+        self.live_tail_ = None
+        self.live_job_ = None
+        self.pool_ = None # AnalysisPool
+        self.index_pool_ = None
+        self.summary_job_ = None
+        self.summary_fingerprints_ = {}
+        self.collect_job_ = None
+        self.selection_ = [] # log tree values of the contests being analyzed
+        self.results_ = {} # contest_id: {kind: result}
+        self.fingerprints_ = {}
+        self.scp_version_ = None # scp.file_version of the request's super check partial file
         self.load_settings()
-        self.init_source()
         self.show_main_screen()
+        self.root_.update_idletasks() # draw the window before anything slow happens
+        self.root_.after_idle(self.open_log_source)
+
+    def open_log_source(self):
+        """Deferred startup: the analysis modules, the log source and the contest list.
+        Contests are listed first, their summary columns follow from the stats caches
+        and missing summaries are computed in the background."""
+        instrument.begin('startup')
+        self.pool_ = workers.AnalysisPool()
+        # summaries are stored once computed, their workers keep no qsos
+        self.index_pool_ = workers.AnalysisPool(max_workers=max(1, (os.cpu_count() or 2) // 2), cache_bytes=0)
+        self.metric_box['values'] = compare.COMPARE_METRICS
+        self.init_source()
+        self.populate_log_tree(summaries=False)
+        self.show_breakdown()
+        self.root_.after_idle(self.populate_log_tree)
+        self.root_.after_idle(self.refresh_summaries)
 
     def init_source(self):
-        file = os.path.join(self.data_source_dir, self.data_source_file.get())
-        self.log_source_ = SQLLogSource(files=[file])
+        """Open the source file(s), several '; ' separated files are federated"""
+        files = [os.path.join(self.data_source_dir, f.strip())
+                 for f in self.data_source_file.get().split(';') if f.strip()]
+        # an archive is opened by selecting its index file
+        files = [os.path.dirname(f) if os.path.basename(f) == sources.ARCHIVE_INDEX else f for f in files]
+        self.close_caches()
+        if len(files) > 1 and all(cabrillo.is_cabrillo(f) for f in files):
+            self.log_source_ = sources.CabrilloLogSource(files=files) # parsed together, in parallel
+        elif len(files) > 1:
+            self.log_source_ = sources.FederatedLogSource(files=files, **self.sql_options())
+        else:
+            self.log_source_ = (sources.open_source(files[0], **self.sql_options()) if files
+                                else sources.SQLLogSource(**self.sql_options()))
+            if 'Source' in self.sort_by and not isinstance(self.log_source_, sources.CabrilloLogSource):
+                self.sort_by = ['StartDate', 'ContestName']
         if not self.log_source_.is_valid():
-            hl.log('ERROR', f'{file} Invalid')
+            hl.log('ERROR', f'{"; ".join(files)} Invalid')
+
+    def sql_options(self) -> dict:
+        """SQLLogSource options of the settings, LOGANALYZER_EXPLAIN=1 logs the queries scanning DXLOG"""
+        options = dict(self.source_options)
+        if os.environ.get('LOGANALYZER_EXPLAIN', '') not in ('', '0'):
+            options['explain'] = True
+        return options
+
+    def stats_cache(self, contest_id):
+        """Sidecar stats cache of the database holding the contest (None if unusable) and its ContestNR there"""
+        db_path, contest_nr = self.log_source_.locate(contest_id)
+        if db_path not in self.stats_caches_:
+            self.stats_caches_[db_path] = caches.open_cache(db_path)
+        return self.stats_caches_[db_path], contest_nr
+
+    def flush_caches(self):
+        """Write the cache hits and results of a request, one transaction per cache"""
+        for db_path, cache in self.stats_caches_.items():
+            if cache is None:
+                continue
+            try:
+                cache.flush()
+            except sqlite3.Error as e:
+                self.disable_cache(db_path, e)
+
+    def disable_cache(self, db_path, error):
+        hl.log('INFO', f'Stats cache disabled: {error}')
+        try:
+            self.stats_caches_[db_path].close()
+        except sqlite3.Error:
+            pass
+        self.stats_caches_[db_path] = None
+
+    def close_caches(self):
+        for cache in self.stats_caches_.values():
+            if cache is not None:
+                cache.close()
+        self.stats_caches_ = {}
+
+    def request_analysis(self):
+        """Show results of the selected contests, computing cache misses in the worker pool"""
+        if self.log_source_ is None:
+            return
+        self.pool_.cancel()
+        if self.collect_job_ is not None:
+            self.root_.after_cancel(self.collect_job_)
+            self.collect_job_ = None
+        instrument.begin('analysis') # ends when the results are shown
+        self.selection_ = self.log_tree.selected_rows()
+        contest_ids = [values[2] for values in self.selection_]
+        self.results_ = {contest_id: {} for contest_id in contest_ids}
+        # fingerprints scan DXLOG, they are looked up off the UI thread
+        self.pool_.lookup_fingerprints(workers.source_spec(self.log_source_), contest_ids)
+        self.collect_job_ = self.root_.after(10, self.analyze_selection)
+
+    def analyze_selection(self):
+        """Second step of request_analysis once the fingerprints are known:
+        cached results are taken as they are, the others computed in the worker pool"""
+        self.fingerprints_ = self.pool_.fingerprints()
+        if self.fingerprints_ is None:
+            self.collect_job_ = self.root_.after(10, self.analyze_selection)
+            return
+        self.collect_job_ = None
+        self.scp_version_ = scp.file_version(self.scp_file.get())
+        contest_ids = list(self.results_)
+        jobs = {}
+        for contest_id in contest_ids:
+            cache, contest_nr = self.stats_cache(contest_id)
+            # only the last selected contest is shown in the per contest tabs
+            kinds = workers.APP_ANALYSES + (workers.APP_DETAIL_ANALYSES if contest_id == contest_ids[-1] else [])
+            for kind in kinds:
+                value = None
+                if cache is not None:
+                    value = cache.get(contest_nr, kind, workers.result_fingerprint(
+                        kind, self.fingerprints_.get(contest_id), self.scp_version_))
+                if value is None:
+                    jobs.setdefault(contest_id, []).append(kind)
+                else:
+                    self.results_[contest_id][kind] = value
+        self.flush_caches()
+        if len(jobs) == 0:
+            self.show_results()
+            return
+        self.pool_.submit(workers.source_spec(self.log_source_), jobs, self.fingerprints_, scp_path=self.scp_file.get())
+        self.progress.configure(maximum=len(jobs), value=0)
+        self.progress.grid()
+        self.collect_job_ = self.root_.after(50, self.collect_results)
+
+    def collect_results(self):
+        for contest_id, results in self.pool_.completed():
+            self.progress.step(1)
+            if isinstance(results, Exception):
+                hl.log('ERROR', f'Analysis of contest {contest_id} failed: {results}')
+                continue
+            self.results_[contest_id].update(results)
+            self.store_results(contest_id, results)
+        self.flush_caches()
+        if self.pool_.pending():
+            self.collect_job_ = self.root_.after(50, self.collect_results)
+            return
+        self.collect_job_ = None
+        self.progress.grid_remove()
+        self.show_results()
+
+    def store_results(self, contest_id, results):
+        cache, contest_nr = self.stats_cache(contest_id)
+        if cache is None:
+            return
+        try:
+            for kind, value in results.items():
+                cache.put(contest_nr, kind, workers.result_fingerprint(kind, self.fingerprints_.get(contest_id),
+                                                                       self.scp_version_), value)
+        except sqlite3.Error as e:
+            self.disable_cache(self.log_source_.locate(contest_id)[0], e)
+
+    def show_results(self):
+        self.populate_stats_tree()
+        self.populate_performance_tree()
+        self.populate_breaks_tree()
+        self.populate_mults_tree()
+        self.populate_check_tree()
+        self.populate_compare_tree()
+        self.show_breakdown()
+
+    def run_operation(self, name, func, *args):
+        """Run a user action as an instrumented operation"""
+        instrument.begin(name)
+        func(*args)
+        self.show_breakdown()
+
+    def show_breakdown(self):
+        """Close the instrumented operation, show where its time went in the status bar"""
+        breakdown = instrument.end()
+        if breakdown is not None and self.status is not None:
+            self.status.configure(text=instrument.format_breakdown(breakdown))
 
     def show_main_screen(self):
         self.root_.geometry(f"{self.ui_width}x{self.ui_height}")
@@ -44,14 +249,26 @@ class LogAnalyzerApp:
         l_frame.grid(row=0, column=0, padx=3, pady=3)
         r_frame = ttk.LabelFrame(self.root_, text="Results")
         r_frame.grid(row=0, column=1, padx=3, pady=3)
+        self.status = None
+        if instrument.enabled:
+            self.status = ttk.Label(self.root_, anchor='w')
+            self.status.grid(row=1, column=0, columnspan=2, padx=3, sticky="ew")
 
         self.file_path_entry = ttk.Entry(l_frame, textvariable=self.data_source_file, width=30)
         self.file_path_entry.grid(row=0, column=0, padx=5, pady=5)
         self.file_select_button = Button(l_frame, text="Browse", command=self.select_source_file)
         self.file_select_button.grid(row=0, column=1, padx=5, pady=5)
+        self.live_button = ttk.Checkbutton(l_frame, text="Live", variable=self.live_mode,
+                                           command=self.toggle_live)
+        self.live_button.grid(row=0, column=2, padx=5, pady=5)
+        self.filter_entry = ttk.Entry(l_frame, textvariable=self.log_filter, width=30)
+        self.filter_entry.grid(row=1, column=0, padx=5, pady=2)
+        ttk.Label(l_frame, text="Filter, e.g. CQWW or QSOs > 1000").grid(row=1, column=1, columnspan=2, sticky="w")
+        self.log_filter.trace_add('write', lambda *args: self.run_operation('filter', self.populate_log_tree))
         logs_frame = ttk.LabelFrame(l_frame, text="Logs", border=2)
-        logs_frame.grid(row=1, column=0, columnspan=2)
-        self.log_tree = ttk.Treeview(logs_frame, columns=('date', 'contest'), show='headings')
+        logs_frame.grid(row=2, column=0, columnspan=3)
+        self.log_tree = VirtualTable(logs_frame, columns=('date', 'contest', 'id', 'source') +
+                                     tuple(SUMMARY_TREE_COLUMNS))
         def create_handler(sort_by):
             def handler():
                 if self.sort_by == sort_by:
@@ -59,42 +276,46 @@ class LogAnalyzerApp:
                 else:
                     self.sort_by = sort_by
                     self.sort_inverted = False
-                self.populate_log_tree()
+                self.run_operation('sort', self.populate_log_tree)
             return handler
         self.log_tree.heading('date', text='Date', command=create_handler(['StartDate', 'ContestName']))
         self.log_tree.heading('contest', text='Contest', command=create_handler(['ContestName', 'StartDate']))
+        self.log_tree.heading('source', text='Source', command=create_handler(['Source', 'StartDate']))
+        for col, (summary_col, text) in SUMMARY_TREE_COLUMNS.items():
+            self.log_tree.heading(col, text=text, command=create_handler([summary_col, 'StartDate']))
+            self.log_tree.column(col, width=60, anchor=tk.E)
+        self.log_tree.set_display_columns(('date', 'contest') + tuple(SUMMARY_TREE_COLUMNS))
         self.log_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5, pady=5 )
 
-        scrollbar = ttk.Scrollbar(logs_frame, orient=tk.VERTICAL, command=self.log_tree.yview)
-        self.log_tree.configure(yscroll=scrollbar.set)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-
-        self.log_tree.bind('<ButtonRelease-1>', self.on_click)
-        self.log_tree.bind("<KeyRelease-Up>", self.on_click)
-        self.log_tree.bind("<KeyRelease-Down>", self.on_click)
-#        self.log_tree.bind(gLeftButton, self.show_context_menu)
+        self.log_tree.bind_rows('<ButtonRelease-1>', self.on_click)
+        for key in ('Up', 'Down', 'Prior', 'Next', 'Home', 'End'):
+            self.log_tree.bind_rows(f'<KeyRelease-{key}>', self.on_click)
+#        self.log_tree.bind_rows(gLeftButton, self.show_context_menu)
         self.populate_log_tree()
 
         # Stats frame
         r_frame.columnconfigure(0, weight=1)
         r_frame.rowconfigure(0, weight=1)
+        self.progress = ttk.Progressbar(r_frame, mode='determinate')
+        self.progress.grid(row=1, column=0, padx=5, pady=3, sticky="ew")
+        self.progress.grid_remove()
 
         notebook = ttk.Notebook(r_frame)
         notebook.grid(row=0, column=0, padx=0, pady=0, sticky="nsew")
         stat_frame = ttk.Frame(notebook)
         stat_frame.grid(sticky="nsew")
-        self.stat_tree = ttk.Treeview(stat_frame, columns=('stat', 'contest'), show='headings', height=15)
+        self.stat_tree = VirtualTable(stat_frame, columns=('stat', 'contest'), height=15)
         self.stat_tree.heading('stat', text='Statistics')
         self.stat_tree.grid(row=0, column=0, sticky="nsew")
 
-        scrollbar = ttk.Scrollbar(stat_frame, orient=tk.VERTICAL, command=self.stat_tree.yview)
-        self.stat_tree.configure(yscroll=scrollbar.set)
-        scrollbar.grid(row=0, column=1, padx=3, pady=5, sticky="ns")
-
         save_stats = Button(stat_frame, text="Save Stats", 
                             command=lambda: save_tree_to_formatted_file(
                                 [("SUMMARY", self.stat_tree),
-                                 ("PERFORMANCE", self.performance_tree)], "stats.txt"))
+                                 ("PERFORMANCE", self.performance_tree),
+                                 ("BREAKS", self.breaks_tree),
+                                 ("MULTS", self.mults_tree),
+                                 ("MULTS PER BAND AND RADIO", self.mult_breakdown_tree),
+                                 ("CHECK", self.check_tree)], "stats.txt"))
         save_stats.grid(row = 1, column=0)
         
         
@@ -102,178 +323,443 @@ class LogAnalyzerApp:
         performance_frame = ttk.Frame(notebook)
         performance_frame.grid(sticky="nsew")
         columns = ['Hour', '160', '80', '40', '20', '15', '10', 'Mults', 'Rate', 'Run %', 'Pct']
-        self.performance_tree = ttk.Treeview(performance_frame,
-                                             columns=columns, show='headings', height=16)
+        self.performance_tree = VirtualTable(performance_frame, columns=columns, height=16)
         self.performance_tree.grid(row=0, column=0, padx=5, pady=5, sticky="nsew")
         for col in columns:
             self.performance_tree.heading(col,text=col)
             self.performance_tree.column(col, width=50)
 
-        scrollbar = ttk.Scrollbar(performance_frame, orient=tk.VERTICAL, command=self.performance_tree.yview)
-        scrollbar.grid(row=0, column=1, padx=3, pady=5, sticky="ns")
-        self.performance_tree.configure(yscrollcommand=scrollbar.set)
+        #Breaks frame
+        breaks_frame = ttk.Frame(notebook)
+        breaks_frame.grid(sticky="nsew")
+        columns = ['Kind', 'From', 'To', 'Duration', 'QSOs', 'Rate']
+        self.breaks_tree = VirtualTable(breaks_frame, columns=columns, height=16)
+        self.breaks_tree.grid(row=0, column=0, padx=5, pady=5, sticky="nsew")
+        for col in columns:
+            self.breaks_tree.heading(col, text=col)
+            self.breaks_tree.column(col, width=120 if col in ('From', 'To') else 60)
         
         notebook.add(stat_frame, text="Stats")
         notebook.add(performance_frame, text="Peformance")
-        
-        self.populate_stats_tree()
-        self.populate_performance_tree()
-
-    def populate_log_tree(self):
+        notebook.add(breaks_frame, text="Breaks")
+
+        #Mults frame
+        mults_frame = ttk.Frame(notebook)
+        mults_frame.grid(sticky="nsew")
+        columns = ['Hour', 'New Continents', 'Continents', 'New Countries', 'Countries', 'New Sections', 'Sections']
+        self.mults_tree = VirtualTable(mults_frame, columns=columns, height=10)
+        self.mults_tree.grid(row=0, column=0, padx=5, pady=5, sticky="nsew")
+        for col in columns:
+            self.mults_tree.heading(col, text=col)
+            self.mults_tree.column(col, width=80 if col.startswith('New') else 70)
+        columns = ['By', 'QSOs', 'Continents', 'Countries', 'Sections']
+        self.mult_breakdown_tree = VirtualTable(mults_frame, columns=columns, height=5)
+        self.mult_breakdown_tree.grid(row=1, column=0, padx=5, pady=5, sticky="nsew")
+        for col in columns:
+            self.mult_breakdown_tree.heading(col, text=col)
+            self.mult_breakdown_tree.column(col, width=70)
+        notebook.add(mults_frame, text="Mults")
+
+        #Check frame: dupes and calls not in the super check partial file
+        check_frame = ttk.Frame(notebook)
+        check_frame.grid(sticky="nsew")
+        ttk.Entry(check_frame, textvariable=self.scp_file, width=40).grid(row=0, column=0, padx=5, pady=3, sticky="w")
+        Button(check_frame, text="SCP file", command=self.select_scp_file).grid(row=0, column=1, padx=5, pady=3)
+        columns = ['Time', 'Call', 'Band', 'Mode', 'Issue', 'Suggestions']
+        self.check_tree = VirtualTable(check_frame, columns=columns, height=14)
+        self.check_tree.grid(row=1, column=0, columnspan=2, padx=5, pady=5, sticky="nsew")
+        for col in columns:
+            self.check_tree.heading(col, text=col)
+            self.check_tree.column(col, width=240 if col == 'Suggestions' else 120 if col == 'Time' else 60)
+        notebook.add(check_frame, text="Check")
+
+        #Compare frame
+        compare_frame = ttk.Frame(notebook)
+        compare_frame.grid(sticky="nsew")
+        self.compare_metric = tk.StringVar(value='QSOs') # values are set with the analysis modules
+        self.metric_box = ttk.Combobox(compare_frame, textvariable=self.compare_metric, state='readonly', width=12)
+        self.metric_box.grid(row=0, column=0, padx=5, pady=3, sticky="w")
+        self.metric_box.bind('<<ComboboxSelected>>', lambda event: self.populate_compare_tree())
+        self.compare_tree = VirtualTable(compare_frame, columns=('hour',), height=15)
+        self.compare_tree.grid(row=1, column=0, padx=5, pady=5, sticky="nsew")
+        notebook.add(compare_frame, text="Compare")
+
+    @instrument.timed()
+    def populate_log_tree(self, summaries=True):
+        """List the contests, summaries: fill the summary columns from the stats caches"""
+        if self.log_source_ is None:
+            return
         if not self.log_source_.is_valid():
+            self.log_tree.clear()
             return
-        for item in self.log_tree.get_children():
-            self.log_tree.delete(item)
-
         if self.sort_inverted:
             dir = 'ASC'
         else:
             dir = 'DESC'
-        logs = self.log_source_.get_contests(sorted_by=self.sort_by, dir=dir)
-        for index, log in logs.iterrows():
-            self.log_tree.insert('', tk.END, values=(log['StartDate'], log['ContestName'], log['ContestNR']))
+        logs = self.log_source_.get_contests(sorted_by=['StartDate', 'ContestName'], dir=dir)
+        federated = 'Source' in logs.columns
+        summaries = self.contest_summaries(logs.ContestNR) if summaries else {}
+        logs = logs.copy()
+        for summary_col, _ in SUMMARY_TREE_COLUMNS.values():
+            logs[summary_col] = [summaries.get(c, {}).get(summary_col, float('nan')) for c in logs.ContestNR]
+        if all(col in logs.columns for col in self.sort_by):
+            logs = logs.sort_values(by=self.sort_by, ascending=[dir == 'ASC', True]) # second is always ascending
+        logs = self.filter_logs(logs).copy()
+        self.log_tree.set_display_columns(('date', 'contest') + (('source',) if federated else ()) +
+                                          tuple(SUMMARY_TREE_COLUMNS))
+        if not federated:
+            logs['Source'] = ''
+        for summary_col, _ in SUMMARY_TREE_COLUMNS.values():
+            logs[summary_col] = [summary_value(summary_col, v) for v in logs[summary_col].tolist()]
+        self.log_tree.set_frame(logs, ['StartDate', 'ContestName', 'ContestNR', 'Source'] +
+                                [summary_col for summary_col, _ in SUMMARY_TREE_COLUMNS.values()],
+                                keys=logs.ContestNR.tolist())
+
+    def filter_logs(self, logs):
+        """Contests matching the filter: name/source text or a query like 'QSOs > 1000'"""
+        text = self.log_filter.get().strip()
+        if not text:
+            return logs
+        if any(op in text for op in '<>='):
+            try:
+                return logs.query(text)
+            except (SyntaxError, NameError, KeyError, ValueError, TypeError) as e:
+                hl.log('INFO', f'Invalid filter <{text}>: {e}')
+                return logs
+        mask = logs.ContestName.str.contains(text, case=False, regex=False)
+        if 'Source' in logs.columns:
+            mask |= logs.Source.str.contains(text, case=False, regex=False)
+        return logs[mask]
+
+    def contest_summaries(self, contest_ids):
+        """{contest_id: summary index row}, empty for contests not summarized yet"""
+        tables = {}
+        summaries = {}
+        for contest_id in contest_ids:
+            db_path, contest_nr = self.log_source_.locate(contest_id)
+            if db_path not in tables:
+                cache = self.stats_cache(contest_id)[0]
+                tables[db_path] = cache.summaries().to_dict('index') if cache is not None else {}
+            summaries[contest_id] = tables[db_path].get(contest_nr, {})
+        return summaries
+
+    def refresh_summaries(self):
+        """Compute missing and outdated contest summaries in the background"""
+        if self.index_pool_ is None:
+            return
+        self.index_pool_.cancel()
+        if self.summary_job_ is not None:
+            self.root_.after_cancel(self.summary_job_)
+            self.summary_job_ = None
+        if not self.log_source_.is_valid():
+            return
+        contests = self.log_source_.get_contests(sorted_by=['StartDate', 'ContestName'], dir='DESC')
+        self.index_pool_.lookup_fingerprints(workers.source_spec(self.log_source_), list(contests.ContestNR))
+        self.summary_job_ = self.root_.after(50, self.summarize_stale)
+
+    def summarize_stale(self):
+        """Second step of refresh_summaries once the fingerprints are known"""
+        self.summary_fingerprints_ = self.index_pool_.fingerprints()
+        if self.summary_fingerprints_ is None:
+            self.summary_job_ = self.root_.after(50, self.summarize_stale)
+            return
+        self.summary_job_ = None
+        by_file = {} # db_path: (cache, {ContestNR: fingerprint}, {ContestNR: contest_id})
+        for contest_id, fingerprint in self.summary_fingerprints_.items():
+            cache, contest_nr = self.stats_cache(contest_id)
+            if cache is None:
+                continue
+            _, fingerprints, ids = by_file.setdefault(self.log_source_.locate(contest_id)[0], (cache, {}, {}))
+            fingerprints[contest_nr] = fingerprint
+            ids[contest_nr] = contest_id
+        jobs = {}
+        for cache, fingerprints, ids in by_file.values():
+            for contest_nr in cache.stale_summaries(fingerprints):
+                jobs[ids[contest_nr]] = ['summary']
+        if len(jobs) == 0:
+            return
+        self.index_pool_.submit(workers.source_spec(self.log_source_), jobs, self.summary_fingerprints_)
+        self.summary_job_ = self.root_.after(250, self.collect_summaries)
+
+    def collect_summaries(self):
+        rows = {} # db_path: [(ContestNR, fingerprint, summary)] stored in one transaction per cache
+        for contest_id, results in self.index_pool_.completed():
+            if isinstance(results, Exception):
+                hl.log('ERROR', f'Summary of contest {contest_id} failed: {results}')
+                continue
+            db_path, contest_nr = self.log_source_.locate(contest_id)
+            rows.setdefault(db_path, []).append((contest_nr, self.summary_fingerprints_.get(contest_id),
+                                                 results['summary']))
+            self.log_tree.update_row(contest_id, dict(zip(SUMMARY_TREE_COLUMNS, summary_values(results['summary']))))
+        for db_path, summaries in rows.items():
+            cache = self.stats_caches_.get(db_path)
+            if cache is None:
+                continue
+            try:
+                cache.put_summaries(summaries)
+            except sqlite3.Error as e:
+                self.disable_cache(db_path, e)
+        if self.index_pool_.pending():
+            self.summary_job_ = self.root_.after(250, self.collect_summaries)
+        else:
+            self.summary_job_ = None
 
+    @instrument.timed()
     def populate_stats_tree(self):
-        selected_items = self.log_tree.selection()  # Get selected item IDs
-        columns = [ f'col{idx}' for idx in range(len(selected_items)+1)]
-        self.stat_tree["columns"] = columns
+        selection = [values for values in self.selection_ if 'stats' in self.results_[values[2]]]
+        columns = [ f'col{idx}' for idx in range(len(selection)+1)]
+        self.stat_tree.set_columns(columns)
         self.stat_tree.heading(columns[0], text='Statistics')
         stats = []
         for idx, col in enumerate(columns[1:]):
-            item_id = selected_items[idx]
-            item = self.log_tree.item(item_id)
-            contest_name = item['values'][1]
-            contest_id = item['values'][2]
+            values = selection[idx]
+            contest_name = ' '.join(str(v) for v in (values[1], values[3]) if v != '')
+            contest_id = values[2]
             self.stat_tree.heading(col, text=contest_name)
-            qs = self.log_source_.get_contest_qsos(contest_id=contest_id)
-            stat, counts_10min, counts_30min, counts_60min = hl.generate_stats(qs)
-            stat = list(stat.items())
+            stat = list(self.results_[contest_id]['stats'].items())
             stat.insert(0,('Power category', self.log_source_.get_contest_info(contest_id)['PowerCategory'][0]))
-            stat.insert(0,  ('Date', datetime.strptime(item['values'][0], "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d-%H:%M")))
-            stat = dict(stat)
-            stats.append((stat, counts_10min, counts_30min, counts_60min))
+            stat.insert(0,  ('Date', datetime.strptime(values[0], "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d-%H:%M")))
+            stats.append(dict(stat))
         if len(stats) == 0:
             return
-        for item in self.stat_tree.get_children():
-            self.stat_tree.delete(item)
+        self.show_stats(stats)
 
-        for key in stats[0][0].keys():
+    def show_stats(self, stats):
+        rows = []
+        for key in stats[0].keys():
             if key == 'Operating Time':
-                formatted_values = []
-                for st in stats:
-                    td = st[0][key]
-                    hours = td.components.days * 24 + td.components.hours
-                    minutes = td.components.minutes
-                    formatted_values.append(f"{hours:02d}:{minutes:02d}")
-                values = [key] + formatted_values
+                rows.append([key] + [hl.format_duration(st[key]) for st in stats])
             else:
-                values = [key] + [st[0][key] for st in stats]
-            self.stat_tree.insert('', tk.END, values=values)
+                rows.append([key] + [st.get(key, '') for st in stats])
+        self.stat_tree.set_rows(rows)
 
+    @instrument.timed()
     def populate_performance_tree(self):
-        selected_items = self.log_tree.selection()  # Get selected item IDs
-        contests = [ f'col{idx}' for idx in range(len(selected_items)+1)]
         stats = []
-        for idx, col in enumerate(contests[1:]):
-            item_id = selected_items[idx]
-            item = self.log_tree.item(item_id)
-            contest_id = item['values'][2]
-            qs = self.log_source_.get_contest_qsos(contest_id=contest_id)
-            stat = hl.generate_pefromance_data(qs, 1, "hours")
-            stat = list(stat.items())
-            stat = dict(stat)
-            stats.append(stat)
+        for values in self.selection_:
+            stat = self.results_[values[2]].get('performance 1 hours')
+            if stat is not None:
+                stats.append(stat)
         if len(stats) == 0:
             return
-        for item in self.performance_tree.get_children():
-            self.performance_tree.delete(item)
-
-        for key in stats[-1].keys():
-            values = [hl.get_hours(key)] + list(stats[-1][key])
-            for i, v in enumerate(values):
-                v = v[0]
-                if i > 5:
-                    break
-
-            self.performance_tree.insert('', tk.END, values=values)
+        self.show_performance(stats[-1])
+
+    def show_performance(self, stat):
+        self.performance_tree.set_rows([hl.get_hours(key)] + list(stat[key]) for key in stat.keys())
+
+
+    @instrument.timed()
+    def populate_compare_tree(self):
+        """Selected contests side by side on hours since their start, deltas against the first one"""
+        curves = {}
+        for values in self.selection_:
+            curve = self.results_[values[2]].get('curve 1 hours')
+            if curve is not None:
+                label = ' '.join(str(v) for v in (values[1], values[0][:10], values[3]) if v != '')
+                curves[label] = curve
+        if len(curves) == 0:
+            self.compare_tree.clear()
+            return
+        table = compare.compare_curves(curves).xs(self.compare_metric.get(), axis=1, level=1)
+        columns = ['hour'] + [f'col{idx}' for idx in range(len(curves))]
+        self.compare_tree.set_columns(columns)
+        self.compare_tree.heading('hour', text='Hour')
+        self.compare_tree.column('hour', width=50)
+        for col, label in zip(columns[1:], table.columns):
+            self.compare_tree.heading(col, text=label)
+            self.compare_tree.column(col, width=120, anchor=tk.E)
+        self.compare_tree.set_rows([f'{hour:g}'] + [int(v) if v == int(v) else round(v, 1) for v in row]
+                                   for hour, row in zip(table.index, table.to_numpy()))
+
+    @instrument.timed()
+    def populate_breaks_tree(self):
+        breaks = [self.results_[values[2]]['breaks'] for values in self.selection_
+                  if 'breaks' in self.results_[values[2]]]
+        if len(breaks) == 0:
+            return
+        self.show_breaks(breaks[-1])
 
+    @instrument.timed()
+    def populate_mults_tree(self):
+        mults = [self.results_[values[2]]['mults'] for values in self.selection_
+                 if 'mults' in self.results_[values[2]]]
+        if len(mults) == 0:
+            return
+        self.show_mults(mults[-1])
+
+    def show_mults(self, mults):
+        """New and total entities per hour, entities per band and per radio"""
+        timeline = mults['timeline']
+        self.mults_tree.set_rows(zip([f'{hour:g}' for hour in timeline.index], *(timeline[col].tolist()
+                                     for col in timeline.columns)))
+        rows = []
+        for by, frame in (('band', mults['per band']), ('radio', mults['per radio'])):
+            for key, row in zip(frame.index, frame.itertuples(index=False)):
+                name = f'{hl.BANDS.get(round(float(key), 1), key)} m' if by == 'band' else f'Radio {key}'
+                rows.append((name,) + tuple(row))
+        self.mult_breakdown_tree.set_rows(rows)
+
+    @instrument.timed()
+    def populate_check_tree(self):
+        checks = [self.results_[values[2]]['check'] for values in self.selection_
+                  if 'check' in self.results_[values[2]]]
+        if len(checks) == 0:
+            return
+        check = checks[-1]
+        self.check_tree.set_rows(zip(check.index.strftime('%Y-%m-%d %H:%M').tolist(), check.Call.tolist(),
+                                     [f'{hl.BANDS.get(round(float(band), 1), band)} m' for band in check.Band.tolist()],
+                                     check.Mode.tolist(), check.Issue.tolist(), check.Suggestions.tolist()))
+
+    def show_breaks(self, breaks):
+        """On-time periods with their rates and the breaks between them"""
+        on = breaks.Kind == 'On'
+        self.breaks_tree.set_rows(zip(breaks.Kind.tolist(), breaks.Start.dt.strftime('%Y-%m-%d %H:%M').tolist(),
+                                      breaks.End.dt.strftime('%Y-%m-%d %H:%M').tolist(),
+                                      [hl.format_duration(d) for d in breaks.Duration.tolist()],
+                                      breaks.QSOs.where(on, '').tolist(), breaks.Rate.where(on, '').tolist()))
 
     def on_click(self, event):
-        try:
-            item = self.log_tree.focus()
-            session_date = self.log_tree.item(item, 'values')[1]
-            self.populate_stats_tree()
-            self.populate_performance_tree()
-        except IndexError:
-            pass # ignore heading click
+        if self.log_tree.focus_row() is None:
+            return
+        if event.type == tk.EventType.ButtonRelease and self.log_tree.identify_region(event.x, event.y) == 'heading':
+            return
+        if self.live_mode.get():
+            self.start_live()
+            return
+        self.request_analysis()
+
+    def toggle_live(self):
+        if self.live_mode.get():
+            self.start_live()
+        else:
+            self.stop_live()
+            self.request_analysis()
+
+    def start_live(self):
+        """Follow the focused contest, refreshing stats every live_interval ms"""
+        self.stop_live()
+        values = self.log_tree.focus_row()
+        if values is None or not self.log_source_.is_valid():
+            return
+        self.live_name_ = ' '.join(str(v) for v in (values[1], values[3]) if v != '')
+        self.pool_.cancel()
+        self.live_tail_ = live.LiveTail(self.log_source_, contest_id=int(values[2]))
+        for tree in (self.stat_tree, self.performance_tree, self.breaks_tree, self.mults_tree,
+                     self.mult_breakdown_tree, self.check_tree):
+            tree.clear()
+        self.refresh_live()
+
+    def stop_live(self):
+        if self.live_job_ is not None:
+            self.root_.after_cancel(self.live_job_)
+        self.live_job_ = None
+        self.live_tail_ = None
+
+    def refresh_live(self):
+        new_qsos = self.live_tail_.poll()
+        if new_qsos or not self.stat_tree.rows():
+            columns = ['col0', 'col1']
+            self.stat_tree.set_columns(columns)
+            self.stat_tree.heading(columns[0], text='Statistics')
+            self.stat_tree.heading(columns[1], text=f'{self.live_name_} (live)')
+            stats = self.live_tail_.stats()
+            if stats['Total QSOs'] > 0:
+                self.show_stats([stats])
+                self.show_performance(self.live_tail_.performance())
+                self.show_breaks(self.live_tail_.breaks())
+                self.show_mults(self.live_tail_.mults())
+        self.live_job_ = self.root_.after(self.live_interval, self.refresh_live)
 
     def display_stats(self):
-        selected_items = self.log_tree.selection()  # Get selected item IDs
-        for item_id in selected_items:
-            item = self.log_tree.item(item_id)
+        for values in self.log_tree.selected_rows():
+            pass
 
 
     def select_source_file(self):
         selected_file = filedialog.askopenfilename(
             title="Select a file",
             initialdir=self.data_source_dir,
-            filetypes=(("DB files", "*.s3db *.db"), ("Cabrillo", "*.log *.txt"), ("All files", "*.*")),
+            filetypes=(("DB files", "*.s3db *.db"), ("Contest archive", sources.ARCHIVE_INDEX), ("Cabrillo", "*.log *.txt"),
+                       ("All files", "*.*")),
             multiple=True
         )
         if selected_file:
-            selected_dir, selected_file = os.path.split(selected_file[0])
-            self.data_source_file.set(selected_file)
+            selected_dir = os.path.dirname(selected_file[0])
+            self.data_source_file.set('; '.join(os.path.basename(f) for f in selected_file))
             self.data_source_dir = selected_dir
             self.save_settings()
+            self.stop_live()
             self.init_source()
             self.populate_log_tree()
+            self.refresh_summaries()
+
+    def select_scp_file(self):
+        selected_file = filedialog.askopenfilename(
+            title="Select a super check partial file",
+            initialdir=os.path.dirname(self.scp_file.get()) or self.data_source_dir,
+            filetypes=(("SCP files", "*.scp"), ("All files", "*.*")))
+        if selected_file:
+            self.scp_file.set(selected_file)
+            self.save_settings()
+            self.request_analysis()
 
     def quit_app(self):
+        self.stop_live()
+        for pool in (self.pool_, self.index_pool_):
+            if pool is not None:
+                pool.shutdown()
         self.ui_width = self.root_.winfo_width()  # Get current width
         self.ui_height = self.root_.winfo_height()
         self.save_settings()
+        self.close_caches()
+        if instrument.enabled:
+            hl.log('INFO', f'Trace written to {instrument.export_trace()}')
+            for path in instrument.dump_profiles(self.config_path_):
+                hl.log('INFO', f'Profile written to {path}')
         self.root_.quit()
 
     def load_settings(self):
         with shelve.open(os.path.join(self.config_path_,'settings')) as settings:
-            self.data_source_file = tk.StringVar(value=settings.get('data_source_file', 'MASTER.SCP'))
+            self.data_source_file = tk.StringVar(value=settings.get('data_source_file', ''))
+            self.scp_file = tk.StringVar(value=settings.get('scp_file', os.path.join(self.data_path, 'MASTER.SCP')))
             self.data_source_dir = settings.get('data_source_dir', self.data_path)
             self.ui_width = settings.get('ui_width',1200)
             self.ui_height =settings.get('ui_height', 500)
             self.sort_by = settings.get('sort_by', ['StartDate', 'ContestName'])
             self.sort_inverted = settings.get('sort_inverted', False)
+            self.live_mode = tk.BooleanVar(value=False)
+            self.log_filter = tk.StringVar(value='')
+            self.live_interval = settings.get('live_interval', 5000) # ms
+            # SQLLogSource options, e.g. {'shadow_index': True} for archived databases, {'explain': True}
+            self.source_options = settings.get('source_options', {})
 
     def save_settings(self):
         with shelve.open(os.path.join(self.config_path_,'settings')) as settings:
             settings['data_source_file'] = self.data_source_file.get()
             settings['data_source_dir'] = self.data_source_dir
+            settings['scp_file'] = self.scp_file.get()
             settings['ui_width'] = self.ui_width
             settings['ui_height'] = self.ui_height
             settings['sort_by'] = self.sort_by
             settings['sort_inverted'] = self.sort_inverted
+            settings['live_interval'] = self.live_interval
+            settings['source_options'] = self.source_options
 
-from tabulate import tabulate
-
-def traverse_tree_for_table(tree, item="", level=0, output=None):
-    """Collect treeview data for table output."""
+def traverse_tree_for_table(tree, output=None):
+    """Collect table data for table output, all rows not only the visible ones."""
     if output is None:
         output = []
-    children = tree.get_children(item)
-    for child in children:
-        text = tree.item(child, "text")  # Get the text of the current item
-        values = tree.item(child, "values")  # Get the values of the current item
-        row = list(values)  # Combine the text and values into a single row
-        output.append(row)
+    for values in tree.rows():
+        output.append(list(values))
     return output
 
 # Function to save treeview contents to a formatted table
 def save_tree_to_formatted_file(trees, filename):
     """Save treeview data as a formatted table to a text file."""
+    from tabulate import tabulate
     with open(filename, "w") as f:
         for title, tree in trees:
-            headers = []
-            for col in tree["columns"]:
-                headers.append(tree.heading(col)["text"])  # Fetch the text of each column header
+            headers = tree.headings()
             data = traverse_tree_for_table(tree)
             table = tabulate(data, headers=headers, tablefmt="grid")
             f.write(title)
@@ -300,7 +786,13 @@ base_path = './'
 config_path = base_path
 data_path = base_path
 
-root = tk.Tk()
-#root.iconbitmap(bitmap=icon_file)
-app = LogAnalyzerApp(root, config_path=config_path, data_path=data_path)
-root.mainloop()
\ No newline at end of file
+def main():
+    multiprocessing.freeze_support()
+    root = tk.Tk()
+    #root.iconbitmap(bitmap=icon_file)
+    app = LogAnalyzerApp(root, config_path=config_path, data_path=data_path)
+    root.mainloop()
+
+if __name__ == "__main__":
+    # worker processes re-import this module, only the main process runs the UI
+    main()
\ No newline at end of file
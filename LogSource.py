@@ -1,8 +1,104 @@
 from typing import Protocol, Any
+from collections import OrderedDict
+import importlib.util
 import pandas as pd
 import os
+import pathlib
 import sqlite3
 import helpers as hl
+import instrument
+
+# compact dtypes of the DXLOG columns used by the analysis
+QSO_DTYPES = {'Band': 'float32', 'RadioNR': 'int8', 'Points': 'int32', 'ContestNR': 'int32',
+              'IsRunQSO': 'bool', 'IsMultiplier1': 'bool', 'IsMultiplier2': 'bool', 'IsMultiplier3': 'bool',
+              'Continent': 'category', 'CountryPrefix': 'category', 'Sect': 'category'}
+
+# N1MM ContestInstance columns, those of an empty contest list
+CONTEST_COLUMNS = ['ContestID', 'ContestName', 'ContestNR', 'StartDate', 'Operator', 'AssistedCategory',
+                   'BandCategory', 'ModeCategory', 'OperatorCategory', 'PowerCategory', 'StationCategory',
+                   'TransmitterCategory', 'Soapbox']
+
+# covering index for per-contest access, N1MM only indexes DXLOG by its own keys
+CONTEST_INDEX = 'CREATE INDEX IF NOT EXISTS DXLOG_ContestNR_TS ON DXLOG (ContestNR, TS)'
+
+def shadow_path(db_path: str) -> str:
+    """Indexed copy of the log database stored next to it"""
+    return db_path + '.index'
+
+def build_shadow(db_path: str) -> str:
+    """Copy of the database with the ContestNR index, rebuilt when the database is newer.
+    return: shadow path, None if it can't be written"""
+    path = shadow_path(db_path)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(db_path):
+        return path
+    tmp_path = path + '.tmp'
+    src = dst = None
+    try:
+        src = sqlite3.connect(pathlib.Path(db_path).resolve().as_uri() + '?mode=ro', uri=True)
+        dst = sqlite3.connect(tmp_path)
+        src.backup(dst)
+        dst.execute(CONTEST_INDEX)
+        dst.execute('ANALYZE')
+        dst.commit()
+    except (sqlite3.Error, OSError) as e:
+        hl.log('INFO', f'No indexed copy of <{db_path}>: {e}')
+        path = None
+    finally:
+        for connection in (src, dst):
+            if connection is not None:
+                connection.close()
+    if path is None:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    os.replace(tmp_path, path)
+    return path
+
+def placeholders(values) -> str:
+    return ','.join('?' * len(values))
+
+def compact_qsos(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert known DXLOG columns to compact dtypes"""
+    dtypes = {col: dtype for col, dtype in QSO_DTYPES.items() if col in df.columns}
+    numeric = [col for col, dtype in dtypes.items() if dtype != 'category']
+    df[numeric] = df[numeric].fillna(0)
+    return df.astype(dtypes)
+
+def merge_chunks(streams: list, chunksize: int = 50000, starts: list = None):
+    """Merge streams of time ordered qso chunks into one time ordered stream.
+    Rows up to the earliest last TS of the chunks at hand can't be preceded by rows still
+    unread, so they are sorted together and yielded, and the exhausted streams read on.
+    starts: first TS of each stream, the streams sorted by it. A stream is only read once the
+    merge reaches its start, so streams following each other in time are read one by one."""
+    streams = [iter(stream) for stream in streams]
+    starts = list(starts) if starts is not None else [None] * len(streams)
+    pending = {} # stream index: rows read and not yielded yet
+    def read(i):
+        for chunk in streams[i]:
+            if len(chunk):
+                pending[i] = chunk
+                return
+        pending.pop(i, None)
+    started = 0 # streams read from, the others start after every row at hand
+    while True:
+        while started < len(streams) and (starts[started] is None or not pending or
+                                          starts[started] <= min(chunk.index[-1] for chunk in pending.values())):
+            read(started)
+            started += 1
+        if not pending:
+            return
+        bound = min(chunk.index[-1] for chunk in pending.values())
+        ready = []
+        for i, chunk in list(pending.items()):
+            end = chunk.index.searchsorted(bound, side='right')
+            ready.append(chunk.iloc[:end])
+            if end == len(chunk):
+                read(i)
+            else:
+                pending[i] = chunk.iloc[end:]
+        merged = pd.concat(ready).sort_index(kind='stable') if len(ready) > 1 else ready[0]
+        for start in range(0, len(merged), chunksize):
+            yield merged.iloc[start:start + chunksize]
 
 class LogSource(Protocol):
     def is_valid(self):
@@ -13,21 +109,122 @@ class LogSource(Protocol):
         ...
     def get_contests(self, sorted_by: str, dir: str) -> pd.DataFrame:
         ...
-    def get_contest_qsos(self, contest_id: int) -> pd.DataFrame:
-        """Retrieve all qsos for the contest."""
+    def get_contest_qsos(self, contest_id: int, columns: list = None, fingerprint=None) -> pd.DataFrame:
+        """Retrieve all qsos for the contest, optionally only the given columns.
+        fingerprint: current get_contest_fingerprints value, cached qsos of another one are reloaded."""
+        ...
+
+    def get_contests_qsos(self, contest_ids: list, columns: list = None, fingerprints: dict = None) -> dict:
+        """Retrieve qsos for many contests at once: {contest_id: qsos}."""
         ...
     
+    def iter_contest_qsos(self, contest_id: int = None, columns: list = None, chunksize: int = 50000):
+        """Yield time ordered chunks of qsos of the contest, of all contests when None."""
+        ...
+
     def get_contest_info(self, contest_id: int) -> pd.DataFrame:
         """Retrieve a specific item by ID."""
         ...
 
+    def get_contest_fingerprints(self, contest_ids: list) -> dict:
+        """Cheap change marker (QSO count, last TS) per contest."""
+        ...
+
+    def get_qsos_since(self, contest_id: int, rowid: int, columns: list = None):
+        """Retrieve qsos added after the rowid high-water mark with their rowid column: (qsos, new high-water mark)."""
+        ...
 
-class SQLLogSource:
-    def __init__(self, files=None):
+    def locate(self, contest_id: int) -> tuple:
+        """Database file and its own ContestNR holding the contest."""
+        ...
+
+
+def sort_contests(contests: pd.DataFrame, sorted_by: list, dir: str) -> pd.DataFrame:
+    """Contests sorted by the columns, dir applies to the first one, the second is always ascending"""
+    return contests.sort_values(by=sorted_by, ascending=[dir.upper() == 'ASC', True])
+
+class ColumnsMixin:
+    """Validation of requested qso columns against dxlog_columns_"""
+    def check_columns(self, columns: list) -> list:
+        """Validate DXLOG column names, return them without TS"""
+        unknown = set(columns) - set(self.dxlog_columns_)
+        if unknown:
+            raise ValueError(f"Unknown DXLOG columns: {sorted(unknown)}")
+        return [c for c in dict.fromkeys(columns) if c != 'TS']
+
+class StaticLogSource(ColumnsMixin):
+    """Base of the sources whose contests never change once opened (archives, Cabrillo logs):
+    contests are read whole, one by one, and nothing has to be invalidated.
+    Subclasses set contests_ and dxlog_columns_ and implement get_contest_qsos and first_ts."""
+    def get_contests(self, sorted_by: str, dir: str) -> pd.DataFrame:
+        """Retrieve list of available contests"""
+        if not self.isvalid_:
+            return {}
+        self.contests_ = sort_contests(self.contests_, sorted_by, dir)
+        return self.contests_
+
+    def get_contests_qsos(self, contest_ids: list, columns: list = None, fingerprints: dict = None) -> dict:
+        """Retrieve qsos for many contests: {contest_id: qsos}."""
+        return {contest_id: self.get_contest_qsos(contest_id, columns) for contest_id in dict.fromkeys(contest_ids)}
+
+    def invalidate(self, contest_id: int = None):
+        """Nothing is cached beyond what the source was opened with"""
+
+    def iter_contest_qsos(self, contest_id: int = None, columns: list = None, chunksize: int = 50000):
+        """Yield time ordered chunks of qsos of the contest, of all contests merged by TS when None."""
+        if not self.isvalid_:
+            return
+        if contest_id is not None:
+            yield from self.contest_chunks(contest_id, columns, chunksize)
+            return
+        # a contest is loaded once the merge reaches its first QSO: only the contests overlapping in time are in memory
+        starts = sorted((first, c) for c in self.contests_.ContestNR if (first := self.first_ts(c)) is not None)
+        yield from merge_chunks([self.contest_chunks(c, columns, chunksize) for _, c in starts], chunksize,
+                                [first for first, _ in starts])
+
+    def contest_chunks(self, contest_id: int, columns: list, chunksize: int):
+        df = self.get_contest_qsos(contest_id, columns).sort_index(kind='stable')
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+
+    def get_qsos_since(self, contest_id: int, rowid: int, columns: list = None):
+        """The contests don't grow: no new qsos."""
+        return pd.DataFrame(), rowid
+
+    def locate(self, contest_id: int) -> tuple:
+        return self.db_path_, contest_id
+
+class SQLLogSource(ColumnsMixin):
+    """N1MM+ SQLite database.
+
+    immutable: the file is an archive nobody writes to, SQLite skips locking
+    and change detection. Not for the database N1MM is logging to.
+    shadow_index: read from an indexed copy (see build_shadow) so loading a
+    contest doesn't scan all of DXLOG. The copy is rebuilt when the database
+    changes, so it suits archives rather than live logs.
+    explain: log query plans that scan DXLOG, once per query."""
+    def __init__(self, files=None, cache_bytes=256 * 1024 * 1024, read_only=True, immutable=False,
+                 shadow_index=False, explain=False, mmap_bytes=256 * 1024 * 1024, page_cache_kib=64 * 1024):
         self.isvalid_ = False
+        self.read_only_ = read_only # never contend with the logger for the write lock
+        self.immutable_ = immutable
+        self.shadow_index_ = shadow_index
+        self.source_args_ = {'immutable': immutable, 'shadow_index': shadow_index, 'explain': explain} # to reopen elsewhere
+        self.explain_ = explain
+        self.explained_ = set()
+        self.mmap_bytes_ = mmap_bytes
+        self.page_cache_kib_ = page_cache_kib
+        self.db_path_ = None
+        self.files_ = []
         self.db_connection_ = None
         self.cursor_ = None
         self.contests_ = None
+        self.dxlog_columns_ = []
+        self.qso_cache_ = OrderedDict() # contest_id: (qsos, columns, size, fingerprint), least recently used first
+        self.cache_bytes_ = cache_bytes
+        self.cached_bytes_ = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
         if files:
             self.initialize(files)
     
@@ -48,6 +245,7 @@ class SQLLogSource:
         self.db_connection_ = None
         self.cursor_ = None
         self.contests_ = None
+        self.invalidate()
 
     def is_valid(self):
         return self.isvalid_
@@ -58,13 +256,32 @@ class SQLLogSource:
             hl.log('ERROR', f'File not found: <{db_path}>')
             return False
         self.close()
-        self.db_connection_ = sqlite3.connect(db_path)
+        self.db_path_ = db_path
+        self.files_ = [db_path]
+        shadow = build_shadow(db_path) if self.shadow_index_ else None
         try:
+            if shadow is not None:
+                # private copy, nobody else writes to it
+                uri = pathlib.Path(shadow).resolve().as_uri() + '?mode=ro&immutable=1'
+                self.db_connection_ = sqlite3.connect(uri, uri=True)
+            elif self.read_only_:
+                uri = pathlib.Path(db_path).resolve().as_uri() + '?mode=ro'
+                if self.immutable_:
+                    uri += '&immutable=1'
+                self.db_connection_ = sqlite3.connect(uri, uri=True)
+            else:
+                self.db_connection_ = sqlite3.connect(db_path)
+            self.db_connection_.execute(f'PRAGMA mmap_size={int(self.mmap_bytes_)}')
+            self.db_connection_.execute(f'PRAGMA cache_size={-int(self.page_cache_kib_)}')
             q = 'SELECT StartDate, ContestName from ContestInstance'
             self.db_connection_.execute(q)
+            q = 'PRAGMA table_info(DXLOG)'
+            self.dxlog_columns_ = [row[1] for row in self.db_connection_.execute(q)]
             self.cursor_ = self.db_connection_.cursor()
             self.isvalid_ = True
         except sqlite3.Error as e:
+            if self.db_connection_:
+                self.db_connection_.close()
             self.db_connection_ = None
             hl.log('INFO', f"Connection is not valid: {e}")
             return False
@@ -76,30 +293,592 @@ class SQLLogSource:
             return {}
         if self.contests_ is None:
             q = f'select * from ContestInstance'
-            self.contests_ = pd.read_sql_query(q, self.db_connection_)
-        isasc = [(dir.upper() == 'ASC'), True] # second is alwayas ascending
-        self.contests_ = self.contests_.sort_values(by=sorted_by, ascending=isasc) 
+            self.contests_ = self.read_sql(q)
+        self.contests_ = sort_contests(self.contests_, sorted_by, dir)
         self.sorted_by_ = sorted_by
         self.sorted_dir_ = dir
         return self.contests_
     
-    def get_contest_qsos(self, contest_id: int) -> pd.DataFrame:
-        """Retrieve all qsos for the contest."""
+    def get_contest_qsos(self, contest_id: int, columns: list = None, fingerprint=None) -> pd.DataFrame:
+        """Retrieve all qsos for the contest, optionally only the given columns."""
         if not self.isvalid_:
             return {}
-        q = f'select * from DXLOG where ContestNR={contest_id}'
-        df = pd.read_sql_query(q, self.db_connection_, index_col='TS', parse_dates='TS')
-        return df
+        fingerprints = {contest_id: fingerprint} if fingerprint is not None else None
+        return self.get_contests_qsos([contest_id], columns, fingerprints)[contest_id]
+
+    def get_contests_qsos(self, contest_ids: list, columns: list = None, fingerprints: dict = None) -> dict:
+        """Retrieve qsos for many contests, loading the uncached ones in one query.
+        columns: DXLOG columns to load besides TS, all when None
+        fingerprints: {contest_id: get_contest_fingerprints value} the caller already has; cached qsos
+                      of a different fingerprint are stale and reloaded. Looked up when not given."""
+        if not self.isvalid_:
+            return {}
+        if columns is not None:
+            columns = self.check_columns(columns)
+        if fingerprints is None and any(c in self.qso_cache_ for c in contest_ids):
+            fingerprints = self.get_contest_fingerprints([c for c in contest_ids if c in self.qso_cache_])
+        qsos = {}
+        for contest_id in contest_ids:
+            if contest_id not in self.qso_cache_:
+                continue
+            df, cached_columns, _, cached_fingerprint = self.qso_cache_[contest_id]
+            if fingerprints.get(contest_id, cached_fingerprint) != cached_fingerprint:
+                self.invalidate(contest_id) # the contest changed since it was loaded
+                continue
+            if columns is None and cached_columns is not None:
+                continue
+            if columns is not None and cached_columns is not None and not set(columns) <= set(cached_columns):
+                continue
+            self.qso_cache_.move_to_end(contest_id)
+            qsos[contest_id] = df if columns is None else df[columns]
+            self.cache_hits += 1
+            instrument.count('qso cache hits')
+        missing = [c for c in dict.fromkeys(contest_ids) if c not in qsos]
+        if len(missing) == 0:
+            return qsos
+        self.cache_misses += len(missing)
+        instrument.count('qso cache misses', len(missing))
+        params = [int(c) for c in missing]
+        if columns is None:
+            q = f'select * from DXLOG where ContestNR in ({placeholders(params)})'
+        else:
+            selected = ', '.join(['TS', 'ContestNR'] + [c for c in columns if c != 'ContestNR'])
+            q = f'select {selected} from DXLOG where ContestNR in ({placeholders(params)})'
+        self.explain(q, params)
+        df = self.read_sql(q, params)
+        # fingerprints of the rows read, from the TS text like get_contest_fingerprints
+        loaded = {int(contest_id): (int(count), last_ts) for contest_id, (count, last_ts)
+                  in df.groupby('ContestNR', sort=False).TS.agg(['size', 'max']).iterrows()}
+        df['TS'] = pd.to_datetime(df.TS)
+        df = compact_qsos(df.set_index('TS'))
+        groups = dict(list(df.groupby('ContestNR', sort=False, observed=True)))
+        for contest_id in missing:
+            cached = groups.get(int(contest_id), df.iloc[0:0])
+            self.cache_qsos(contest_id, cached, columns, loaded.get(int(contest_id), (0, None)))
+            qsos[contest_id] = cached if columns is None else cached[columns]
+        return qsos
+
+    def cache_qsos(self, contest_id: int, df: pd.DataFrame, columns: list = None, fingerprint=None):
+        """Keep parsed qsos with the fingerprint they were read at, evicting least recently used
+        contests above cache_bytes"""
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        if size > self.cache_bytes_:
+            return
+        self.invalidate(contest_id)
+        self.qso_cache_[contest_id] = (df, columns, size, fingerprint)
+        self.cached_bytes_ += size
+        while self.cached_bytes_ > self.cache_bytes_:
+            _, (_, _, evicted, _) = self.qso_cache_.popitem(last=False)
+            self.cached_bytes_ -= evicted
+
+    def invalidate(self, contest_id: int = None):
+        """Drop cached qsos of one contest or all of them"""
+        if contest_id is None:
+            self.qso_cache_.clear()
+            self.cached_bytes_ = 0
+        elif contest_id in self.qso_cache_:
+            self.cached_bytes_ -= self.qso_cache_.pop(contest_id)[2]
     
+    def iter_contest_qsos(self, contest_id: int = None, columns: list = None, chunksize: int = 50000):
+        """Yield time ordered chunks of qsos of the contest, of all contests when None.
+        Chunks are read straight from the database and bypass the qso cache."""
+        if not self.isvalid_:
+            return
+        selected = ', '.join(['TS'] + self.check_columns(columns)) if columns is not None else '*'
+        where = 'where ContestNR=? ' if contest_id is not None else ''
+        params = [int(contest_id)] if contest_id is not None else []
+        q = f'select {selected} from DXLOG {where}order by TS'
+        self.explain(q, params)
+        for chunk in pd.read_sql_query(q, self.db_connection_, params=params, index_col='TS', parse_dates='TS',
+                                       chunksize=chunksize):
+            instrument.count('rows loaded', len(chunk))
+            yield compact_qsos(chunk)
+
+    def get_qsos_since(self, contest_id: int, rowid: int, columns: list = None):
+        """Retrieve qsos of the contest added after the DXLOG rowid high-water mark.
+        return: (qsos with their DXLOG rowid column, new high-water mark)"""
+        if not self.isvalid_:
+            return pd.DataFrame(), rowid
+        selected = ', '.join(['rowid', 'TS'] + self.check_columns(columns)) if columns is not None else 'rowid, *'
+        q = f'select {selected} from DXLOG where rowid > ? and ContestNR=?'
+        df = self.read_sql(q, [int(rowid), int(contest_id)], index_col='TS', parse_dates='TS')
+        if len(df) == 0:
+            return df, rowid
+        return compact_qsos(df), int(df.rowid.max())
+
+    def locate(self, contest_id: int) -> tuple:
+        """Database file and its own ContestNR holding the contest."""
+        return self.db_path_, contest_id
+
     def get_contest_info(self, contest_id: int) -> pd.DataFrame:
         """Retrieve a specific item by ID."""
         if not self.isvalid_:
             hl.log('ERROR', 'No database connected')
             return pd.DataFrame()
-        q = f'select * from ContestInstance where ContestNR={contest_id}'
-        contest_df = pd.read_sql_query(q, self.db_connection_)
+        q = 'select * from ContestInstance where ContestNR=?'
+        contest_df = self.read_sql(q, [int(contest_id)])
         return contest_df
-    
+
+    def get_contest_fingerprints(self, contest_ids: list) -> dict:
+        """Cheap change marker (QSO count, last TS) per contest."""
+        if not self.isvalid_ or len(contest_ids) == 0:
+            return {}
+        params = [int(c) for c in contest_ids]
+        q = f'select ContestNR, count(*), max(TS) from DXLOG where ContestNR in ({placeholders(params)}) group by ContestNR'
+        self.explain(q, params)
+        fingerprints = {int(c): (0, None) for c in contest_ids}
+        with instrument.span('sql fingerprints'):
+            for contest_id, count, last_ts in self.db_connection_.execute(q, params):
+                fingerprints[contest_id] = (count, last_ts)
+        return fingerprints
+
+    def read_sql(self, q: str, params: list = (), **kwargs) -> pd.DataFrame:
+        """Query into a DataFrame, timed as an 'sql <table>' span"""
+        table = q.split(' from ')[1].split()[0]
+        with instrument.span(f'sql {table}', query=q):
+            df = pd.read_sql_query(q, self.db_connection_, params=params, **kwargs)
+        instrument.count('rows loaded', len(df))
+        return df
+
+    def query_plan(self, q: str, params: list = ()) -> list:
+        """EXPLAIN QUERY PLAN details of the query"""
+        return [row[3] for row in self.db_connection_.execute('EXPLAIN QUERY PLAN ' + q, params)]
+
+    def explain(self, q: str, params: list = ()):
+        """Log full DXLOG scans of the query when explain is on, once per query text"""
+        if not self.explain_ or q in self.explained_:
+            return
+        self.explained_.add(q)
+        scans = [d for d in self.query_plan(q, params) if d.startswith('SCAN') and 'DXLOG' in d]
+        if scans:
+            hl.log('INFO', f'{self.db_path_}: {"; ".join(scans)} in <{q}>')
+
+class FederatedLogSource:
+    """Many N1MM databases, e.g. one per operator, seen as a single log source.
+
+    Contests get federated ids, (file index << SOURCE_BITS) | ContestNR, and a
+    Source column with the file name. Databases are opened on first use and
+    the least recently used one is closed when more than max_open are open."""
+    SOURCE_BITS = 32
+
+    def __init__(self, files=None, max_open=4, **source_args):
+        self.isvalid_ = False
+        self.files_ = []
+        self.max_open_ = max_open
+        self.source_args_ = source_args
+        self.sources_ = OrderedDict() # file index: SQLLogSource, least recently used first
+        self.contests_ = None
+        if files:
+            self.initialize(files)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        for source in self.sources_.values():
+            source.close()
+        self.sources_.clear()
+        self.contests_ = None
+
+    def is_valid(self):
+        return self.isvalid_
+
+    def initialize(self, files: list) -> bool:
+        """Open every file, the federation is valid when at least one of them opens"""
+        self.close()
+        self.files_ = []
+        for f in files:
+            if not os.path.exists(f):
+                hl.log('ERROR', f'File not found: <{f}>')
+                continue
+            source = open_source(f, **self.source_args_)
+            if not source.is_valid():
+                hl.log('ERROR', f'{f} Invalid')
+                source.close()
+                continue
+            self.sources_[len(self.files_)] = source
+            self.files_.append(f)
+            while len(self.sources_) > self.max_open_:
+                _, idle = self.sources_.popitem(last=False)
+                idle.close()
+        self.isvalid_ = len(self.files_) > 0
+        return self.isvalid_
+
+    def source(self, index: int):
+        """Open database or archive of the file index, closing idle ones above max_open"""
+        if index in self.sources_:
+            self.sources_.move_to_end(index)
+            return self.sources_[index]
+        source = open_source(self.files_[index], **self.source_args_)
+        self.sources_[index] = source
+        while len(self.sources_) > self.max_open_:
+            _, idle = self.sources_.popitem(last=False)
+            idle.close()
+        return source
+
+    def federated_id(self, index: int, contest_nr: int) -> int:
+        return (index << self.SOURCE_BITS) | int(contest_nr)
+
+    def split_id(self, contest_id: int) -> tuple:
+        """(file index, ContestNR in that file)"""
+        contest_id = int(contest_id)
+        return contest_id >> self.SOURCE_BITS, contest_id & ((1 << self.SOURCE_BITS) - 1)
+
+    def by_source(self, contest_ids: list) -> dict:
+        """{file index: {ContestNR: federated id}}"""
+        groups = {}
+        for contest_id in contest_ids:
+            index, contest_nr = self.split_id(contest_id)
+            groups.setdefault(index, {})[contest_nr] = contest_id
+        return groups
+
+    def locate(self, contest_id: int) -> tuple:
+        index, contest_nr = self.split_id(contest_id)
+        return self.files_[index], contest_nr
+
+    def get_contests(self, sorted_by: str, dir: str) -> pd.DataFrame:
+        """Retrieve contests of all databases"""
+        if not self.isvalid_:
+            return {}
+        if self.contests_ is None:
+            frames = []
+            for index, file in enumerate(self.files_):
+                source = self.source(index)
+                if not source.is_valid():
+                    continue
+                contests = source.get_contests(['StartDate', 'ContestName'], dir).copy()
+                contests['SourceContestNR'] = contests.ContestNR
+                contests['ContestNR'] = [self.federated_id(index, c) for c in contests.ContestNR]
+                if 'Source' not in contests.columns: # Cabrillo logs have their station callsign
+                    contests['Source'] = os.path.splitext(os.path.basename(file))[0]
+                frames.append(contests)
+            self.contests_ = (pd.concat(frames, ignore_index=True) if frames else
+                              pd.DataFrame(columns=CONTEST_COLUMNS + ['SourceContestNR', 'Source']))
+        if len(self.contests_) == 0:
+            return self.contests_
+        self.contests_ = sort_contests(self.contests_, sorted_by, dir)
+        return self.contests_
+
+    def get_contest_qsos(self, contest_id: int, columns: list = None, fingerprint=None) -> pd.DataFrame:
+        """Retrieve all qsos for the contest."""
+        index, contest_nr = self.split_id(contest_id)
+        return self.source(index).get_contest_qsos(contest_nr, columns, fingerprint)
+
+    def get_contests_qsos(self, contest_ids: list, columns: list = None, fingerprints: dict = None) -> dict:
+        """Retrieve qsos for many contests with one query per database."""
+        qsos = {}
+        for index, ids in self.by_source(contest_ids).items():
+            source_fingerprints = None
+            if fingerprints is not None:
+                source_fingerprints = {contest_nr: fingerprints[c] for contest_nr, c in ids.items() if c in fingerprints}
+            for contest_nr, df in self.source(index).get_contests_qsos(list(ids), columns, source_fingerprints).items():
+                qsos[ids[contest_nr]] = df
+        return qsos
+
+    def iter_contest_qsos(self, contest_id: int = None, columns: list = None, chunksize: int = 50000):
+        """Yield time ordered chunks of qsos of the contest, of all contests of all databases when None.
+        The databases are read side by side and their chunks merged by TS."""
+        if contest_id is not None:
+            index, contest_nr = self.split_id(contest_id)
+            yield from self.source(index).iter_contest_qsos(contest_nr, columns, chunksize)
+            return
+        # every database stays open while its stream is merged, whatever max_open is
+        sources = [open_source(file, **self.source_args_) for file in self.files_]
+        try:
+            yield from merge_chunks([source.iter_contest_qsos(None, columns, chunksize) for source in sources],
+                                    chunksize)
+        finally:
+            for source in sources:
+                source.close()
+
+    def get_qsos_since(self, contest_id: int, rowid: int, columns: list = None):
+        index, contest_nr = self.split_id(contest_id)
+        return self.source(index).get_qsos_since(contest_nr, rowid, columns)
+
+    def get_contest_info(self, contest_id: int) -> pd.DataFrame:
+        """Retrieve a specific item by ID."""
+        index, contest_nr = self.split_id(contest_id)
+        contest_df = self.source(index).get_contest_info(contest_nr)
+        if len(contest_df):
+            contest_df['SourceContestNR'] = contest_df.ContestNR
+            contest_df['ContestNR'] = int(contest_id)
+        return contest_df
+
+    def get_contest_fingerprints(self, contest_ids: list) -> dict:
+        fingerprints = {}
+        for index, ids in self.by_source(contest_ids).items():
+            for contest_nr, fingerprint in self.source(index).get_contest_fingerprints(list(ids)).items():
+                fingerprints[ids[contest_nr]] = fingerprint
+        return fingerprints
+
+# contest archive layout: <dir>/contests.parquet and <dir>/dxlog/<ContestNR>.<feather|parquet>
+ARCHIVE_INDEX = 'contests.parquet'
+ARCHIVE_FORMATS = ['feather', 'parquet']
+ARCHIVE_FINGERPRINT = ['ArchiveQSOs', 'ArchiveLastTS'] # index columns besides ContestInstance
+
+def is_archive(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, ARCHIVE_INDEX))
+
+def open_source(path: str, **source_args):
+    """Log source of a database file, a contest archive or Cabrillo logs (file or directory)"""
+    from cabrillo import is_cabrillo # cabrillo builds on this module
+    if is_archive(path):
+        return ArchiveLogSource(files=[path])
+    if os.path.isdir(path) or is_cabrillo(path):
+        return CabrilloLogSource(files=[path])
+    return SQLLogSource(files=[path], **source_args)
+
+def export_archive(db_path: str, archive_dir: str, contest_ids: list = None, format: str = 'feather') -> list:
+    """Write contests of the database to a columnar archive, one file per contest.
+    Feather files are uncompressed Arrow and get memory mapped when read, parquet ones are smaller.
+    Contests already archived with the same fingerprint are skipped.
+    return: ContestNRs written"""
+    if format not in ARCHIVE_FORMATS:
+        raise ValueError(f'Unknown archive format {format}, use one of {ARCHIVE_FORMATS}')
+    source = SQLLogSource(files=[db_path])
+    if not source.is_valid():
+        return []
+    os.makedirs(os.path.join(archive_dir, 'dxlog'), exist_ok=True)
+    contests = source.get_contests(['StartDate', 'ContestName'], 'ASC').copy()
+    if contest_ids is not None:
+        contests = contests[contests.ContestNR.isin([int(c) for c in contest_ids])]
+    index_path = os.path.join(archive_dir, ARCHIVE_INDEX)
+    archived = (pd.read_parquet(index_path) if os.path.exists(index_path)
+                else pd.DataFrame(columns=['ContestNR'] + ARCHIVE_FINGERPRINT))
+    old = archived.set_index('ContestNR')[ARCHIVE_FINGERPRINT]
+    archived = archived[~archived.ContestNR.isin(contests.ContestNR)]
+    fingerprints = source.get_contest_fingerprints(list(contests.ContestNR))
+    written = []
+    for contest_id in contests.ContestNR:
+        contest_id = int(contest_id)
+        count, last_ts = fingerprints[contest_id]
+        path = os.path.join(archive_dir, 'dxlog', f'{contest_id}.{format}')
+        if (contest_id in old.index and os.path.exists(path) and
+                tuple(old.loc[contest_id]) == (count, last_ts)):
+            continue
+        qsos = source.get_contest_qsos(contest_id).reset_index()
+        if format == 'feather':
+            qsos.to_feather(path, compression='uncompressed')
+        else:
+            qsos.to_parquet(path, index=False)
+        for other in ARCHIVE_FORMATS:
+            stale = os.path.join(archive_dir, 'dxlog', f'{contest_id}.{other}')
+            if other != format and os.path.exists(stale):
+                os.remove(stale)
+        source.invalidate(contest_id)
+        written.append(contest_id)
+    contests['ArchiveQSOs'] = [fingerprints[int(c)][0] for c in contests.ContestNR]
+    contests['ArchiveLastTS'] = [fingerprints[int(c)][1] for c in contests.ContestNR]
+    frames = [f for f in (archived, contests) if len(f)]
+    pd.concat(frames, ignore_index=True).to_parquet(index_path, index=False)
+    source.close()
+    return written
+
+class ArchiveLogSource(StaticLogSource):
+    """Contests exported by export_archive, read column by column.
+
+    The archive never changes, so there is no qso cache: feather files are
+    memory mapped and only the requested columns are read."""
+    def __init__(self, files=None):
+        self.isvalid_ = False
+        self.db_path_ = None
+        self.files_ = []
+        self.source_args_ = {}
+        self.contests_ = None
+        self.index_ = None
+        self.dxlog_columns_ = []
+        if files:
+            self.initialize(files)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.isvalid_ = False
+        self.contests_ = None
+        self.index_ = None
+
+    def is_valid(self):
+        return self.isvalid_
+
+    def initialize(self, files: list) -> bool:
+        archive_dir = files[0]
+        if not is_archive(archive_dir):
+            hl.log('ERROR', f'Not a contest archive: <{archive_dir}>')
+            return False
+        if importlib.util.find_spec('pyarrow') is None:
+            hl.log('ERROR', 'Contest archives require pyarrow')
+            return False
+        self.close()
+        self.db_path_ = archive_dir
+        self.files_ = [archive_dir]
+        self.index_ = pd.read_parquet(os.path.join(archive_dir, ARCHIVE_INDEX))
+        self.contests_ = self.index_.drop(columns=ARCHIVE_FINGERPRINT)
+        self.dxlog_columns_ = []
+        if len(self.index_):
+            self.dxlog_columns_ = self.schema(int(self.index_.ContestNR.iloc[0]))
+        self.isvalid_ = True
+        return True
+
+    def partition(self, contest_id: int) -> str:
+        for format in ARCHIVE_FORMATS:
+            path = os.path.join(self.db_path_, 'dxlog', f'{int(contest_id)}.{format}')
+            if os.path.exists(path):
+                return path
+        raise KeyError(f'Contest {contest_id} is not in archive <{self.db_path_}>')
+
+    def schema(self, contest_id: int) -> list:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        path = self.partition(contest_id)
+        if path.endswith('.parquet'):
+            return pq.read_schema(path).names
+        with pa.memory_map(path) as f:
+            return pa.ipc.open_file(f).schema.names
+
+    def read_partition(self, contest_id: int, columns: list = None) -> pd.DataFrame:
+        import pyarrow.feather as feather
+        import pyarrow.parquet as pq
+        path = self.partition(contest_id)
+        selected = ['TS'] + columns if columns is not None else None
+        with instrument.span('archive read', path=path):
+            if path.endswith('.parquet'):
+                table = pq.read_table(path, columns=selected, memory_map=True)
+            else:
+                table = feather.read_table(path, columns=selected, memory_map=True)
+            df = table.to_pandas(split_blocks=True).set_index('TS')
+        instrument.count('rows loaded', len(df))
+        return df
+
+    def get_contest_qsos(self, contest_id: int, columns: list = None, fingerprint=None) -> pd.DataFrame:
+        """Retrieve all qsos for the contest, optionally only the given columns."""
+        if not self.isvalid_:
+            return {}
+        if columns is not None:
+            columns = self.check_columns(columns)
+        return self.read_partition(contest_id, columns)
+
+    def first_ts(self, contest_id: int):
+        """TS of the first qso of the contest, None when it has none; reads only the TS column"""
+        ts = self.read_partition(contest_id, []).index
+        return ts.min() if len(ts) else None
+
+    def get_contest_info(self, contest_id: int) -> pd.DataFrame:
+        """Retrieve a specific item by ID."""
+        if not self.isvalid_:
+            hl.log('ERROR', 'No archive opened')
+            return pd.DataFrame()
+        info = self.index_[self.index_.ContestNR == int(contest_id)]
+        return info.drop(columns=ARCHIVE_FINGERPRINT).reset_index(drop=True)
+
+    def get_contest_fingerprints(self, contest_ids: list) -> dict:
+        """QSO count and last TS recorded when the contest was archived."""
+        if not self.isvalid_:
+            return {}
+        index = self.index_.set_index('ContestNR')
+        fingerprints = {}
+        for contest_id in contest_ids:
+            row = index.loc[int(contest_id)] if int(contest_id) in index.index else None
+            fingerprints[int(contest_id)] = (0, None) if row is None else (int(row.ArchiveQSOs), row.ArchiveLastTS)
+        return fingerprints
+
+class CabrilloLogSource(StaticLogSource):
+    """Cabrillo logs, e.g. of other stations for comparison, one contest per log.
+
+    All logs are parsed when opened, in parallel and through the parse cache
+    of cabrillo.read_cabrillos. ContestNR is derived from the file path so it
+    stays the same when logs are added to the directory. The Source column
+    is the station callsign."""
+    def __init__(self, files=None, max_workers=None):
+        self.isvalid_ = False
+        self.db_path_ = None
+        self.files_ = []
+        self.source_args_ = {}
+        self.max_workers_ = max_workers
+        self.contests_ = None
+        self.qsos_ = {} # ContestNR: qsos
+        self.dxlog_columns_ = []
+        if files:
+            self.initialize(files)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.isvalid_ = False
+        self.contests_ = None
+        self.qsos_ = {}
+
+    def is_valid(self):
+        return self.isvalid_
+
+    def initialize(self, files: list) -> bool:
+        from cabrillo import HEADER_COLUMNS, cabrillo_files, read_cabrillos
+        paths = [path for f in files for path in cabrillo_files(f)]
+        if len(paths) == 0:
+            hl.log('ERROR', f'No Cabrillo logs in <{"; ".join(files)}>')
+            return False
+        self.close()
+        self.files_ = list(files)
+        self.db_path_ = files[0] if os.path.isdir(files[0]) else os.path.dirname(os.path.abspath(files[0]))
+        rows = []
+        for path, (header, qsos) in zip(paths, read_cabrillos(paths, self.max_workers_)):
+            contest_id = int(qsos.ContestNR.iloc[0]) if len(qsos) else None
+            if contest_id is None or contest_id in self.qsos_:
+                hl.log('INFO', f'Skipped <{path}>: no QSOs or same ContestNR as another log')
+                continue
+            self.qsos_[contest_id] = qsos
+            row = {'ContestID': contest_id, 'ContestNR': contest_id,
+                   'StartDate': qsos.index.min().strftime('%Y-%m-%d %H:%M:%S')}
+            row.update({col: header.get(tag, '') for tag, col in HEADER_COLUMNS.items()})
+            row['Source'] = header.get('CALLSIGN') or os.path.splitext(os.path.basename(path))[0]
+            rows.append(row)
+        if len(rows) == 0:
+            return False
+        self.contests_ = pd.DataFrame(rows)
+        self.dxlog_columns_ = ['TS'] + list(next(iter(self.qsos_.values())).columns)
+        self.isvalid_ = True
+        return True
+
+    def get_contest_qsos(self, contest_id: int, columns: list = None, fingerprint=None) -> pd.DataFrame:
+        """Retrieve all qsos of the log, optionally only the given columns."""
+        if not self.isvalid_:
+            return {}
+        qsos = self.qsos_[int(contest_id)]
+        return qsos if columns is None else qsos[self.check_columns(columns)]
+
+    def first_ts(self, contest_id: int):
+        """TS of the first qso of the log, None when it has none"""
+        qsos = self.qsos_[int(contest_id)]
+        return qsos.index.min() if len(qsos) else None
+
+    def get_contest_info(self, contest_id: int) -> pd.DataFrame:
+        """Retrieve a specific item by ID."""
+        if not self.isvalid_:
+            hl.log('ERROR', 'No Cabrillo logs opened')
+            return pd.DataFrame()
+        return self.contests_[self.contests_.ContestNR == int(contest_id)].reset_index(drop=True)
+
+    def get_contest_fingerprints(self, contest_ids: list) -> dict:
+        """Cheap change marker (QSO count, last TS) per log."""
+        fingerprints = {}
+        for contest_id in contest_ids:
+            qsos = self.qsos_.get(int(contest_id))
+            if qsos is None or len(qsos) == 0:
+                fingerprints[int(contest_id)] = (0, None)
+            else:
+                fingerprints[int(contest_id)] = (len(qsos), qsos.index.max().strftime('%Y-%m-%d %H:%M:%S'))
+        return fingerprints
+
 if __name__ == "__main__":
     ds = SQLLogSource()
     if not ds.initialize(['./db/nu6n.s3db']):
@@ -110,4 +889,5 @@ if __name__ == "__main__":
     print(c)
     q = ds.get_contest_qsos(contest_id=df.ContestNR.iloc[-1])
     print(q.head(20))
+    hl.show_stats(hl.generate_stats_from_chunks(ds.iter_contest_qsos(columns=hl.STATS_COLUMNS)))
 
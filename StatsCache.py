@@ -0,0 +1,142 @@
+import pickle
+import sqlite3
+import time
+import pandas as pd
+import helpers as hl
+import instrument
+
+SUMMARY_COLUMNS = ['QSOs', 'Score', 'FirstTS', 'LastTS', 'Hours', 'Rate10', 'Rate60']
+
+CACHE_VERSION = 5 # bump when the layout of cached results changes
+
+def sidecar_path(db_path: str) -> str:
+    """Cache file stored next to the log database"""
+    return db_path + '.stats'
+
+class StatsCache:
+    """Persistent store of computed contest results.
+
+    Results are keyed by ContestNR and result kind and are valid only while the
+    DXLOG fingerprint (QSO count, last TS) of the contest stays the same.
+    Least recently used results are evicted once the store exceeds max_bytes.
+    The summary table keeps one small row per contest for the contest list."""
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024):
+        self.path_ = path
+        self.max_bytes_ = max_bytes
+        self.used_ = {} # (ContestNR, Kind): time of the hits not yet written, see flush
+        self.stored_ = False # results put since the last flush
+        self.db_connection_ = sqlite3.connect(path)
+        version = self.db_connection_.execute('PRAGMA user_version').fetchone()[0]
+        if version != CACHE_VERSION:
+            self.db_connection_.execute('DROP TABLE IF EXISTS results')
+            self.db_connection_.execute('DROP TABLE IF EXISTS summary')
+            self.db_connection_.execute(f'PRAGMA user_version={CACHE_VERSION}')
+        self.db_connection_.execute("""CREATE TABLE IF NOT EXISTS results (
+                                        ContestNR INTEGER, Kind TEXT, Fingerprint TEXT,
+                                        Size INTEGER, LastUsed REAL, Data BLOB,
+                                        PRIMARY KEY (ContestNR, Kind))""")
+        self.db_connection_.execute("""CREATE TABLE IF NOT EXISTS summary (
+                                        ContestNR INTEGER PRIMARY KEY, Fingerprint TEXT,
+                                        QSOs INTEGER, Score INTEGER, FirstTS TEXT, LastTS TEXT,
+                                        Hours REAL, Rate10 INTEGER, Rate60 INTEGER)""")
+        self.db_connection_.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if not self.db_connection_:
+            return
+        try:
+            self.flush()
+        finally:
+            self.db_connection_.close()
+            self.db_connection_ = None
+
+    def get(self, contest_id: int, kind: str, fingerprint):
+        """Cached result or None when missing or computed for different QSOs.
+        Reads don't write: the hit is recorded for eviction by the next flush"""
+        row = self.db_connection_.execute(
+            'SELECT Fingerprint, Data FROM results WHERE ContestNR=? AND Kind=?',
+            (int(contest_id), kind)).fetchone()
+        if row is None or row[0] != repr(fingerprint):
+            instrument.count('stats cache misses')
+            return None
+        instrument.count('stats cache hits')
+        self.used_[(int(contest_id), kind)] = time.time()
+        return pickle.loads(row[1])
+
+    def flush(self):
+        """Commit the results put and the LastUsed times of the hits since the last flush
+        in one transaction, evicting once"""
+        if not self.used_ and not self.stored_:
+            return
+        self.db_connection_.executemany('UPDATE results SET LastUsed=? WHERE ContestNR=? AND Kind=?',
+                                        [(used, contest_id, kind) for (contest_id, kind), used in self.used_.items()])
+        if self.stored_:
+            self.evict()
+        self.db_connection_.commit()
+        self.used_ = {}
+        self.stored_ = False
+
+    def put(self, contest_id: int, kind: str, fingerprint, value):
+        """Store a result, written to the file by the next flush"""
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.used_.pop((int(contest_id), kind), None)
+        self.db_connection_.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)',
+                                    (int(contest_id), kind, repr(fingerprint), len(data),
+                                     time.time(), data))
+        self.stored_ = True
+
+    def stale_summaries(self, fingerprints: dict) -> list:
+        """Contests of {contest_id: fingerprint} without an up to date summary"""
+        stored = dict(self.db_connection_.execute('SELECT ContestNR, Fingerprint FROM summary'))
+        return [c for c, fingerprint in fingerprints.items() if stored.get(int(c)) != repr(fingerprint)]
+
+    def put_summaries(self, rows: list):
+        """Store [(contest_id, fingerprint, summary)] in one transaction"""
+        self.db_connection_.executemany('INSERT OR REPLACE INTO summary VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                        [[int(contest_id), repr(fingerprint)] + [summary.get(col) for col in SUMMARY_COLUMNS]
+                                         for contest_id, fingerprint, summary in rows])
+        self.db_connection_.commit()
+
+    def summaries(self) -> pd.DataFrame:
+        """Summary rows indexed by ContestNR"""
+        q = f'SELECT ContestNR, {", ".join(SUMMARY_COLUMNS)} FROM summary'
+        return pd.read_sql_query(q, self.db_connection_, index_col='ContestNR')
+
+    def invalidate(self, contest_id: int = None):
+        """Drop results of one contest or everything"""
+        if contest_id is None:
+            self.db_connection_.execute('DELETE FROM results')
+            self.db_connection_.execute('DELETE FROM summary')
+        else:
+            self.db_connection_.execute('DELETE FROM results WHERE ContestNR=?', (int(contest_id),))
+            self.db_connection_.execute('DELETE FROM summary WHERE ContestNR=?', (int(contest_id),))
+        self.db_connection_.commit()
+
+    def evict(self):
+        """Remove least recently used results above the size limit"""
+        total = self.db_connection_.execute('SELECT COALESCE(SUM(Size), 0) FROM results').fetchone()[0]
+        if total <= self.max_bytes_:
+            return
+        rows = self.db_connection_.execute(
+            'SELECT ContestNR, Kind, Size FROM results ORDER BY LastUsed').fetchall()
+        for contest_id, kind, size in rows:
+            if total <= self.max_bytes_:
+                break
+            self.db_connection_.execute('DELETE FROM results WHERE ContestNR=? AND Kind=?',
+                                        (contest_id, kind))
+            total -= size
+
+def open_cache(db_path: str):
+    """Open sidecar cache of the database, None if it can't be used"""
+    path = sidecar_path(db_path)
+    try:
+        return StatsCache(path)
+    except (sqlite3.Error, OSError) as e:
+        hl.log('INFO', f'Stats cache disabled for <{path}>: {e}')
+        return None
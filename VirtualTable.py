@@ -0,0 +1,216 @@
+import tkinter as tk
+from tkinter import ttk
+
+SHIFT = 0x0001 # event.state modifier bits
+CONTROL = 0x0004
+
+class VirtualTable(ttk.Frame):
+    """Table of any number of rows drawn in a fixed pool of Treeview items.
+
+    Rows are plain value tuples held in Python; only the rows scrolled into
+    view are written to the pooled items and only when their values change,
+    so scrolling, selecting and replacing the rows cost the visible rows, not
+    the table size. Selection is kept by row key and survives set_rows."""
+    def __init__(self, parent, columns, height: int = 10, **tree_args):
+        super().__init__(parent)
+        self.tree_ = ttk.Treeview(self, columns=columns, height=height, show='headings', **tree_args)
+        self.scrollbar_ = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.tree_.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar_.grid(row=0, column=1, sticky="ns")
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+        self.rows_ = [] # value tuples in display order
+        self.keys_ = []
+        self.index_ = {} # key: row index
+        self.offset_ = 0 # index of the first visible row
+        self.visible_ = height # rows that fit in the widget
+        self.pool_ = [] # Treeview item per visible row
+        self.shown_ = [] # values written to the pooled items, None when detached
+        self.selected_ = set() # keys
+        self.focus_ = None # key
+        self.anchor_ = None # key shift selections extend from
+        self.tree_.bind('<Button-1>', self.on_press)
+        self.tree_.bind('<Configure>', self.on_configure)
+        for key, step in (('<Up>', -1), ('<Down>', 1), ('<Prior>', 'page-'), ('<Next>', 'page+'),
+                          ('<Home>', 'home'), ('<End>', 'end')):
+            self.tree_.bind(key, lambda event, step=step: self.on_key(event, step))
+            self.tree_.bind(key.replace('<', '<Shift-'), lambda event, step=step: self.on_key(event, step))
+        self.tree_.bind('<MouseWheel>', lambda event: self.scroll(-3 if event.delta > 0 else 3))
+        self.tree_.bind('<Button-4>', lambda event: self.scroll(-3))
+        self.tree_.bind('<Button-5>', lambda event: self.scroll(3))
+
+    def heading(self, column, **kwargs):
+        return self.tree_.heading(column, **kwargs)
+
+    def column(self, column, **kwargs):
+        return self.tree_.column(column, **kwargs)
+
+    def bind_rows(self, sequence, func):
+        """Bind an event of the rows area"""
+        self.tree_.bind(sequence, func, add='+')
+
+    def identify_region(self, x, y):
+        return self.tree_.identify_region(x, y)
+
+    def set_columns(self, columns, display=None):
+        """Replace the columns, display: subset of them to show, all by default"""
+        self.tree_['columns'] = columns
+        self.tree_['displaycolumns'] = display if display is not None else '#all'
+        self.shown_ = [None if values is None else () for values in self.shown_] # rewrite every item
+
+    def set_display_columns(self, display):
+        self.tree_['displaycolumns'] = display
+
+    def headings(self) -> list:
+        return [self.tree_.heading(col)['text'] for col in self.tree_['columns']]
+
+    def set_rows(self, rows, keys=None):
+        """Show rows (sequences of column values), keys identify them for the selection, positions by default"""
+        self.rows_ = [tuple(row) for row in rows]
+        self.keys_ = list(keys) if keys is not None else list(range(len(self.rows_)))
+        self.index_ = dict(zip(self.keys_, range(len(self.keys_))))
+        self.selected_ &= self.index_.keys()
+        if self.focus_ not in self.index_:
+            self.focus_ = None
+        self.offset_ = max(0, min(self.offset_, len(self.rows_) - self.visible_))
+        self.render()
+
+    def set_frame(self, df, columns, keys=None):
+        """Show DataFrame columns, read column wise"""
+        self.set_rows(zip(*(df[col].tolist() for col in columns)) if len(columns) else [()] * len(df), keys)
+
+    def clear(self):
+        self.set_rows([])
+
+    def rows(self) -> list:
+        return self.rows_
+
+    def update_row(self, key, values: dict):
+        """Change {column: value} of the row with the key, redrawn only when visible"""
+        index = self.index_.get(key)
+        if index is None:
+            return
+        row = list(self.rows_[index])
+        columns = list(self.tree_['columns'])
+        for col, value in values.items():
+            row[columns.index(col)] = value
+        self.rows_[index] = tuple(row)
+        if self.offset_ <= index < self.offset_ + self.visible_:
+            self.render()
+
+    def selected_rows(self) -> list:
+        """Selected rows in display order"""
+        return [self.rows_[i] for i in sorted(self.index_[key] for key in self.selected_)]
+
+    def focus_row(self):
+        return self.rows_[self.index_[self.focus_]] if self.focus_ in self.index_ else None
+
+    def select(self, keys):
+        self.selected_ = set(keys) & self.index_.keys()
+        self.render()
+
+    def see(self, key):
+        index = self.index_.get(key)
+        if index is None:
+            return
+        if index < self.offset_:
+            self.offset_ = index
+        elif index >= self.offset_ + self.visible_:
+            self.offset_ = index - self.visible_ + 1
+        self.render()
+
+    def yview(self, *args):
+        """Scrollbar command"""
+        if args[0] == 'moveto':
+            self.offset_ = round(float(args[1]) * len(self.rows_))
+        elif args[0] == 'scroll':
+            self.offset_ += int(args[1]) * (self.visible_ if args[2] == 'pages' else 1)
+        self.offset_ = max(0, min(self.offset_, len(self.rows_) - self.visible_))
+        self.render()
+
+    def scroll(self, rows):
+        self.yview('scroll', rows, 'units')
+        return 'break'
+
+    def render(self):
+        """Write the visible rows to the pooled items, touching only the ones that changed"""
+        count = max(0, min(self.visible_, len(self.rows_) - self.offset_))
+        while len(self.pool_) < count:
+            self.pool_.append(self.tree_.insert('', tk.END))
+            self.shown_.append(())
+        for position, item in enumerate(self.pool_):
+            if position < count:
+                values = self.rows_[self.offset_ + position]
+                if self.shown_[position] is None:
+                    self.tree_.move(item, '', position)
+                if self.shown_[position] != values:
+                    self.tree_.item(item, values=values)
+                    self.shown_[position] = values
+            elif self.shown_[position] is not None:
+                self.tree_.detach(item)
+                self.shown_[position] = None
+        visible_keys = self.keys_[self.offset_:self.offset_ + count]
+        selection = tuple(item for item, key in zip(self.pool_, visible_keys) if key in self.selected_)
+        if selection != self.tree_.selection():
+            self.tree_.selection_set(selection)
+        if self.focus_ in visible_keys:
+            self.tree_.focus(self.pool_[visible_keys.index(self.focus_)])
+        self.tree_.yview_moveto(0)
+        if len(self.rows_) == 0:
+            self.scrollbar_.set(0, 1)
+        else:
+            self.scrollbar_.set(self.offset_ / len(self.rows_), (self.offset_ + count) / len(self.rows_))
+
+    def on_configure(self, event):
+        """Size the pool to the rows fitting the widget"""
+        if not self.pool_ or self.shown_[0] is None:
+            return
+        bbox = self.tree_.bbox(self.pool_[0])
+        if not bbox:
+            return
+        self.visible_ = max(1, (event.height - bbox[1]) // bbox[3])
+        self.offset_ = max(0, min(self.offset_, len(self.rows_) - self.visible_))
+        self.render()
+
+    def on_press(self, event):
+        """Click selection: plain selects one row, Control toggles, Shift extends from the anchor"""
+        if self.tree_.identify_region(event.x, event.y) not in ('cell', 'tree'):
+            return None # headings keep their sort commands and resizing
+        item = self.tree_.identify_row(event.y)
+        if item not in self.pool_:
+            return 'break'
+        index = self.offset_ + self.pool_.index(item)
+        if index >= len(self.rows_):
+            return 'break'
+        self.tree_.focus_set()
+        self.select_index(index, event.state)
+        return 'break'
+
+    def on_key(self, event, step):
+        if len(self.rows_) == 0:
+            return 'break'
+        current = self.index_.get(self.focus_, self.offset_ - 1 if step != -1 else self.offset_ + self.visible_)
+        if step == 'home':
+            index = 0
+        elif step == 'end':
+            index = len(self.rows_) - 1
+        elif step in ('page-', 'page+'):
+            index = current + (self.visible_ if step == 'page+' else -self.visible_)
+        else:
+            index = current + step
+        self.select_index(max(0, min(index, len(self.rows_) - 1)), event.state & SHIFT)
+        return 'break'
+
+    def select_index(self, index: int, state: int):
+        key = self.keys_[index]
+        if state & SHIFT and self.anchor_ in self.index_:
+            start, end = sorted((self.index_[self.anchor_], index))
+            self.selected_ = set(self.keys_[start:end + 1])
+        elif state & CONTROL:
+            self.selected_ ^= {key}
+            self.anchor_ = key
+        else:
+            self.selected_ = {key}
+            self.anchor_ = key
+        self.focus_ = key
+        self.see(key)
@@ -0,0 +1,244 @@
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import helpers as hl
+import instrument
+from LogSource import FederatedLogSource, SQLLogSource
+from compare import contest_curve
+from mults import generate_mults
+import scp
+
+# available analysis results, by stats cache kind
+ANALYSES = {'stats': hl.generate_contest_stats,
+            'performance 1 hours': partial(hl.generate_pefromance_data, increment=1, increment_unit='hours'),
+            'performance frame 1 hours': partial(hl.performance_frame, increment=1, increment_unit='hours'),
+            'summary': hl.generate_summary,
+            'breaks': hl.generate_off_times,
+            'curve 1 hours': contest_curve,
+            'mults': generate_mults,
+            'check': scp.check_qsos}
+OFF_TIME_ANALYSES = {'stats', 'summary', 'breaks'} # take the contest's minimum off time
+START_ANALYSES = {'curve 1 hours'} # take the contest's StartDate
+SCP_ANALYSES = {'check'} # take the index of the scp_path file
+EXTRA_COLUMNS = {'check': scp.CHECK_COLUMNS} # DXLOG columns loaded besides hl.QSO_COLUMNS
+APP_ANALYSES = ['stats', 'curve 1 hours'] # results shown by the app for every selected contest
+APP_DETAIL_ANALYSES = ['performance 1 hours', 'breaks', 'mults', 'check'] # and for the last selected one only
+
+QSO_CACHE_BYTES = 256 * 1024 * 1024 # qso frames kept by the workers of a pool, split between them
+BATCH_QSOS = 100000 # QSOs a worker loads with one query at most, their frames are in memory together
+CACHING_SOURCES = (SQLLogSource, FederatedLogSource) # sources taking cache_bytes
+
+_local = threading.local() # log sources opened by this worker process or thread, by source spec
+_cache_bytes = None # qso cache size of the sources of this worker process, see init_worker
+
+def init_worker(cache_bytes: int):
+    """Process initializer of the pool workers: their share of the qso cache"""
+    global _cache_bytes
+    _cache_bytes = cache_bytes
+
+def source_spec(source) -> tuple:
+    """Picklable recipe to reopen the log source in a worker process"""
+    return (type(source), tuple(source.files_), tuple(sorted(source.source_args_.items())))
+
+def worker_source(spec: tuple):
+    """The log source of the spec, opened once per process or thread (SQLite connections are per thread)"""
+    sources = _local.__dict__.setdefault('sources', {})
+    source = sources.get(spec)
+    if source is None or not source.is_valid():
+        source_type, files, source_args = spec
+        source_args = dict(source_args)
+        if _cache_bytes is not None and issubclass(source_type, CACHING_SOURCES):
+            source_args['cache_bytes'] = _cache_bytes
+        source = source_type(files=list(files), **source_args)
+        sources[spec] = source
+    return source
+
+def contest_min_off(info):
+    """Minimum off time of the contest rules"""
+    return hl.min_off_time(info.ContestName.iloc[0] if len(info) else '')
+
+def contest_start(info):
+    """StartDate of the contest, None when unknown"""
+    return info.StartDate.iloc[0] if len(info) and info.StartDate.iloc[0] else None
+
+def result_fingerprint(kind: str, fingerprint, scp_version=None):
+    """Fingerprint a stats cache result of the kind is valid for: the contest's,
+    with the scp.file_version of the checked file for SCP_ANALYSES"""
+    return (fingerprint, scp_version) if kind in SCP_ANALYSES else fingerprint
+
+def analysis_columns(kinds: list) -> list:
+    return list(dict.fromkeys(hl.QSO_COLUMNS + [col for kind in kinds for col in EXTRA_COLUMNS.get(kind, [])]))
+
+def batches(contest_ids: list, count: int, fingerprints: dict = None, max_qsos: int = BATCH_QSOS) -> list:
+    """Contests split between count workers: [(worker, contest ids of a batch)].
+    A contest always goes to worker contest_id % count, where its qsos may still be cached.
+    The share of a worker is cut into batches of at most max_qsos QSOs by the QSO counts of
+    the fingerprints, a contest above it alone; the worker runs its batches one after the other"""
+    shares = {}
+    for contest_id in contest_ids:
+        shares.setdefault(int(contest_id) % count, []).append(contest_id)
+    split = []
+    for worker, share in shares.items():
+        batch, qsos = [], 0
+        for contest_id in share:
+            fingerprint = (fingerprints or {}).get(contest_id)
+            size = int(fingerprint[0]) if fingerprint else 0
+            if batch and qsos + size > max_qsos:
+                split.append((worker, batch))
+                batch, qsos = [], 0
+            batch.append(contest_id)
+            qsos += size
+        split.append((worker, batch))
+    return split
+
+def contest_fingerprints(spec: tuple, contest_ids: list) -> dict:
+    """get_contest_fingerprints of the source, runs off the UI thread"""
+    return worker_source(spec).get_contest_fingerprints(contest_ids)
+
+def analyze_qsos(source, contest_id: int, qs, kinds: list, scp_path: str = None) -> dict:
+    info = source.get_contest_info(contest_id)
+    index = scp.load_index(scp_path) if scp_path and SCP_ANALYSES & set(kinds) else None
+    def options(kind):
+        if kind in OFF_TIME_ANALYSES:
+            return {'min_off': contest_min_off(info)}
+        if kind in START_ANALYSES:
+            return {'start': contest_start(info)}
+        return {'index': index} if kind in SCP_ANALYSES else {}
+    return {kind: ANALYSES[kind](qs, **options(kind)) for kind in kinds}
+
+def analyze_contests(spec: tuple, jobs: dict, fingerprints: dict = None, scp_path: str = None) -> dict:
+    """Compute {contest_id: [kinds]} of one source loading the contests in one query, runs in a worker process.
+    fingerprints: {contest_id: fingerprint} the results are for, cached qsos of other ones are reloaded
+    scp_path: super check partial file of the SCP_ANALYSES, calls are not checked without it
+    return: {contest_id: {kind: result} or the exception it failed with}"""
+    source = worker_source(spec)
+    columns = analysis_columns([kind for kinds in jobs.values() for kind in kinds])
+    with instrument.span('load qsos', contests=len(jobs)):
+        qsos = source.get_contests_qsos(list(jobs), columns=columns, fingerprints=fingerprints)
+    results = {}
+    for contest_id, kinds in jobs.items():
+        try:
+            results[contest_id] = analyze_qsos(source, contest_id, qsos[contest_id], kinds, scp_path)
+        except Exception as e: # reported per contest, the others of the batch still count
+            results[contest_id] = e
+    return results
+
+def analyze_contest(spec: tuple, contest_id: int, kinds: list, fingerprint=None, scp_path: str = None) -> dict:
+    """Compute analysis results of one contest, runs in a worker process"""
+    source = worker_source(spec)
+    with instrument.span('load qsos', contest=contest_id):
+        qs = source.get_contest_qsos(contest_id, columns=analysis_columns(kinds), fingerprint=fingerprint)
+    return analyze_qsos(source, contest_id, qs, kinds, scp_path)
+
+def traced_result(result):
+    """Result of a job submitted through instrument.traced_call, merging its spans"""
+    if isinstance(result, tuple):
+        result, events, counted = result
+        instrument.merge(events, counted)
+    return result
+
+class AnalysisPool:
+    """Computes contests in parallel worker processes.
+
+    Contests are split into batches of at most BATCH_QSOS QSOs, each loaded
+    with one query (a contest query scans N1MM's unindexed DXLOG, a batch
+    scans it once), so memory stays bounded however many contests are
+    submitted. A contest always goes to the same worker, which keeps its qsos in its
+    share of cache_bytes. Every submit supersedes the previous request: its pending batches are
+    cancelled and results still arriving for it are dropped. Fingerprints are
+    looked up by a thread: one aggregate query that SQLite runs without the
+    GIL, so the UI keeps drawing and no worker process has to start."""
+    def __init__(self, max_workers: int = None, cache_bytes: int = QSO_CACHE_BYTES):
+        self.max_workers_ = max_workers or os.cpu_count() or 1
+        self.cache_bytes_ = cache_bytes
+        self.executors_ = {} # worker: single process executor
+        self.lookup_executor_ = None
+        self.lookup_ = None # future of the latest fingerprint lookup
+        self.request_ = 0
+        self.futures_ = {} # future: contest ids of its batch
+        self.done_ = queue.Queue() # (request, future), filled by executor threads
+
+    def lookup_fingerprints(self, spec: tuple, contest_ids: list):
+        """Start looking up the fingerprints of the contests, superseding the previous lookup"""
+        if self.lookup_executor_ is None:
+            self.lookup_executor_ = ThreadPoolExecutor(1)
+        if self.lookup_ is not None:
+            self.lookup_.cancel()
+        self.lookup_ = self.lookup_executor_.submit(contest_fingerprints, spec, list(contest_ids))
+
+    def fingerprints(self):
+        """{contest_id: fingerprint} of the latest lookup, None while it runs, {} when it failed"""
+        if self.lookup_ is None or not self.lookup_.done():
+            return None
+        if self.lookup_.cancelled():
+            return {}
+        error = self.lookup_.exception()
+        if error is not None:
+            hl.log('ERROR', f'Contest fingerprints failed: {error}')
+            return {}
+        return self.lookup_.result()
+
+    def submit(self, spec: tuple, jobs: dict, fingerprints: dict = None, **options):
+        """Start computing {contest_id: [kinds]} for the {contest_id: fingerprint},
+        options: analyze_contests keyword arguments"""
+        self.cancel()
+        request = self.request_
+        for worker, batch in batches(list(jobs), self.max_workers_, fingerprints):
+            batch_jobs = {contest_id: jobs[contest_id] for contest_id in batch}
+            batch_fingerprints = ({c: fingerprints[c] for c in batch if c in fingerprints}
+                                  if fingerprints is not None else None)
+            executor = self.executor(worker)
+            if instrument.enabled: # worker spans come back with the results
+                future = executor.submit(instrument.traced_call, analyze_contests, spec, batch_jobs,
+                                         batch_fingerprints, **options)
+            else:
+                future = executor.submit(analyze_contests, spec, batch_jobs, batch_fingerprints, **options)
+            future.add_done_callback(lambda f: self.done_.put((request, f)))
+            self.futures_[future] = batch
+
+    def executor(self, worker: int):
+        """Process of the worker, started on first use"""
+        if worker not in self.executors_:
+            # spawn never forks the Tk process, the same on all platforms
+            self.executors_[worker] = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn'),
+                                                          initializer=init_worker,
+                                                          initargs=(self.cache_bytes_ // self.max_workers_,))
+        return self.executors_[worker]
+
+    def cancel(self):
+        for future in self.futures_:
+            future.cancel()
+        self.futures_ = {}
+        self.request_ += 1
+
+    def pending(self) -> int:
+        """Batches still running"""
+        return len(self.futures_)
+
+    def completed(self) -> list:
+        """[(contest_id, results or exception)] finished since the last call for the latest request"""
+        finished = []
+        while True:
+            try:
+                request, future = self.done_.get_nowait()
+            except queue.Empty:
+                return finished
+            if request != self.request_ or future.cancelled():
+                continue
+            batch = self.futures_.pop(future, [])
+            error = future.exception()
+            if error is not None:
+                finished.extend((contest_id, error) for contest_id in batch)
+            else:
+                finished.extend(traced_result(future.result()).items())
+
+    def shutdown(self):
+        self.cancel()
+        for executor in list(self.executors_.values()) + [self.lookup_executor_]:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self.executors_ = {}
+        self.lookup_executor_ = None
@@ -0,0 +1,182 @@
+"""Timing and peak memory benchmarks of the analysis pipeline on synthetic databases.
+
+    python benchmark.py --sizes 1000 10000 100000 --save-baseline bench_baseline.json
+    python benchmark.py --sizes 1000 10000 100000 --baseline bench_baseline.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+import pandas as pd
+import helpers as hl
+from LogSource import ArchiveLogSource, SQLLogSource, export_archive
+from cabrillo import parse_cabrillos
+from compare import contest_curve
+from mults import generate_mults
+from scp import SCPIndex, check_qsos, load_index, read_scp
+from synthetic import write_cabrillo, write_database, write_scp
+from Workers import contest_start
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+STARTUP_BUDGET = 0.3 # seconds from a fresh interpreter to the app module imported
+
+def load_qsos(source, contest_id):
+    source.invalidate()
+    return source.get_contest_qsos(contest_id, columns=hl.QSO_COLUMNS)
+
+def cases(db_path):
+    """{name: (setup, run)}: setup result is passed to run, only run is measured"""
+    def opened():
+        source = SQLLogSource(files=[db_path])
+        return source, source.get_contest_qsos(1, columns=hl.QSO_COLUMNS).sort_index()
+    def started():
+        source, qsos = opened()
+        return qsos, contest_start(source.get_contest_info(1))
+    def checked():
+        source = SQLLogSource(files=[db_path])
+        return source.get_contest_qsos(1, columns=['Call', 'Band', 'Mode']), load_index(scp_file(db_path))
+    return {
+        'initialize': (lambda: None, lambda _: SQLLogSource(files=[db_path])),
+        'get_contests': (lambda: SQLLogSource(files=[db_path]),
+                         lambda source: source.get_contests(['StartDate', 'ContestName'], 'DESC')),
+        # what the app does before the contest list shows
+        'first contest list': (lambda: None, lambda _: SQLLogSource(files=[db_path]).get_contests(
+                                   ['StartDate', 'ContestName'], 'DESC')),
+        'get_contest_qsos': (lambda: SQLLogSource(files=[db_path]), lambda source: load_qsos(source, 1)),
+        # a small contest of a growing database: scan vs. index lookup
+        'get_contest_qsos small': (lambda: SQLLogSource(files=[db_path]), lambda source: load_qsos(source, 2)),
+        'get_contest_qsos small indexed': (lambda: SQLLogSource(files=[db_path], shadow_index=True),
+                                           lambda source: load_qsos(source, 2)),
+        'get_contest_qsos archive': (lambda: ArchiveLogSource(files=[archive(db_path)]), lambda source: load_qsos(source, 1)),
+        'parse_cabrillo': (lambda: cabrillo_log(db_path), lambda path: parse_cabrillos([path])),
+        'generate_stats': (opened, lambda ctx: hl.generate_stats(ctx[1])),
+        'contest_curve': (started, lambda ctx: contest_curve(*ctx)),
+        'generate_mults': (opened, lambda ctx: generate_mults(ctx[1])),
+        # super check partial of 40000 calls, 90% of the contest's calls among them
+        'scp index': (lambda: scp_file(db_path), lambda path: SCPIndex(read_scp(path))),
+        'check_qsos': (checked, lambda ctx: check_qsos(*ctx)),
+        'generate_off_times': (opened, lambda ctx: hl.generate_off_times(ctx[1], pd.Timedelta(minutes=60))),
+        'windowed_count': (opened, lambda ctx: hl.windowed_count(hl.timestamps_ns(ctx[1].index),
+                                                                 pd.Timedelta(minutes=60))),
+        'generate_pefromance_data': (opened, lambda ctx: hl.generate_pefromance_data(ctx[1], 1, 'hours')),
+        'generate_pefromance_data 1 minute': (opened, lambda ctx: hl.generate_pefromance_data(ctx[1], 1, 'minutes')),
+    }
+
+def measure(setup, run, repeat):
+    """Best wall time of repeat runs and peak traced memory of one run"""
+    best = float('inf')
+    for _ in range(repeat):
+        ctx = setup()
+        start = time.perf_counter()
+        run(ctx)
+        best = min(best, time.perf_counter() - start)
+    ctx = setup()
+    tracemalloc.start()
+    run(ctx)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': best, 'peak_bytes': peak}
+
+def startup_time(repeat):
+    """Best wall time of a fresh interpreter importing the app, which must not import pandas"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        status = subprocess.run([sys.executable, '-c', "import sys, LogAnalyzer; sys.exit('pandas' in sys.modules)"],
+                                cwd=os.path.dirname(os.path.abspath(__file__))).returncode
+        best = min(best, time.perf_counter() - start)
+        if status != 0:
+            print('REGRESSION startup: LogAnalyzer imports pandas')
+            return float('inf')
+    return best
+
+def database(data_dir, size, **kwargs):
+    """Synthetic database with a contest of size qsos plus two small ones, reused when present"""
+    path = os.path.join(data_dir, f'synthetic_{size}.s3db')
+    if not os.path.exists(path):
+        write_database(path, contests=3, qsos=[size, 500, 500], seed=size, **kwargs)
+    return path
+
+def archive(db_path):
+    """Feather archive of the database, reused when present"""
+    archive_dir = os.path.splitext(db_path)[0] + '_archive'
+    export_archive(db_path, archive_dir)
+    return archive_dir
+
+def cabrillo_log(db_path):
+    """Cabrillo log as big as the database's big contest, reused when present"""
+    path = os.path.splitext(db_path)[0] + '.log'
+    if not os.path.exists(path):
+        size = int(os.path.splitext(db_path)[0].rsplit('_', 1)[1])
+        write_cabrillo(path, qsos=size, seed=size)
+    return path
+
+def scp_file(db_path):
+    """Super check partial file holding 90% of the calls of the database's first contest, reused when present"""
+    path = os.path.splitext(db_path)[0] + '.scp'
+    if not os.path.exists(path):
+        calls = SQLLogSource(files=[db_path]).get_contest_qsos(1, columns=['Call']).Call
+        write_scp(path, calls.drop_duplicates().sample(frac=0.9, random_state=0))
+    return path
+
+def run_benchmarks(sizes, data_dir, repeat=3, **kwargs):
+    """{'<case> <size>': {'seconds', 'peak_bytes'}}"""
+    os.makedirs(data_dir, exist_ok=True)
+    results = {'startup': {'seconds': startup_time(repeat), 'peak_bytes': 0}}
+    print(f"{'startup':36s} {'':>8s} {results['startup']['seconds'] * 1000:10.1f} ms")
+    for size in sizes:
+        db_path = database(data_dir, size, **kwargs)
+        for name, (setup, run) in cases(db_path).items():
+            results[f'{name} {size}'] = measure(setup, run, repeat)
+            print(f"{name:36s} {size:>8d} {results[f'{name} {size}']['seconds'] * 1000:10.1f} ms "
+                  f"{results[f'{name} {size}']['peak_bytes'] / 1e6:8.1f} MB")
+    return results
+
+# absolute slack so that timer noise of millisecond cases isn't reported
+SLACK = {'seconds': 0.005, 'peak_bytes': 1024 * 1024}
+
+def regressions(results, baseline, tolerance):
+    """Cases slower or bigger than the baseline by more than tolerance (fraction)"""
+    failed = []
+    for case, base in baseline.items():
+        if case not in results:
+            continue
+        for metric in ('seconds', 'peak_bytes'):
+            if results[case][metric] > base[metric] * (1 + tolerance) + SLACK[metric]:
+                failed.append(f'{case}: {metric} {results[case][metric]:.4g} > baseline {base[metric]:.4g}')
+    return failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the log analysis pipeline')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='QSOs of the big contest')
+    parser.add_argument('--data-dir', default='bench_data', help='where synthetic databases are kept')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--radios', type=int, default=2)
+    parser.add_argument('--run-ratio', type=float, default=0.6)
+    parser.add_argument('--breaks', type=int, default=3)
+    parser.add_argument('--baseline', help='fail on regressions against this results file')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed slowdown, 0.5 = 50%%')
+    parser.add_argument('--save-baseline', help='write results to this file')
+    parser.add_argument('--startup-budget', type=float, default=STARTUP_BUDGET,
+                        help='fail when importing the app takes longer (seconds)')
+    args = parser.parse_args(argv)
+    results = run_benchmarks(args.sizes, args.data_dir, args.repeat, radios=args.radios,
+                             run_ratio=args.run_ratio, breaks=args.breaks)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=1)
+    failed = []
+    if results['startup']['seconds'] > args.startup_budget:
+        failed.append(f"startup: {results['startup']['seconds']:.3f} s > budget {args.startup_budget} s")
+    if args.baseline:
+        with open(args.baseline) as f:
+            failed += regressions(results, json.load(f), args.tolerance)
+    for line in failed:
+        print('REGRESSION', line)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
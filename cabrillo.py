@@ -0,0 +1,190 @@
+"""Cabrillo log parsing into DXLOG like frames."""
+import multiprocessing
+import os
+import pickle
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import instrument
+from LogSource import compact_qsos
+
+CABRILLO_EXTENSIONS = ('.log', '.txt', '.cbr')
+PARSE_CACHE_DIR = '.parsed' # parsed logs are kept in this directory next to them
+PARALLEL_MIN = 8 # parse in a process pool from this many uncached logs on
+
+# band lower edges in MHz, as N1MM stores the Band column
+BAND_EDGES = np.array([1.8, 3.5, 7.0, 10.0, 14.0, 18.0, 21.0, 24.0, 28.0,
+                       50.0, 70.0, 144.0, 222.0, 420.0, 902.0, 1200.0])
+MODES = {'CW': 'CW', 'PH': 'SSB', 'RY': 'RTTY', 'DG': 'DIG', 'FM': 'FM'}
+
+# header tag: ContestInstance column
+HEADER_COLUMNS = {'CONTEST': 'ContestName', 'OPERATORS': 'Operator',
+                  'CATEGORY-ASSISTED': 'AssistedCategory', 'CATEGORY-BAND': 'BandCategory',
+                  'CATEGORY-MODE': 'ModeCategory', 'CATEGORY-OPERATOR': 'OperatorCategory',
+                  'CATEGORY-POWER': 'PowerCategory', 'CATEGORY-STATION': 'StationCategory',
+                  'CATEGORY-TRANSMITTER': 'TransmitterCategory', 'SOAPBOX': 'Soapbox'}
+
+def is_cabrillo(path: str) -> bool:
+    """File starting with START-OF-LOG"""
+    if not os.path.isfile(path):
+        return False
+    try:
+        with open(path, encoding='latin-1') as f:
+            return f.readline().strip().upper().startswith('START-OF-LOG')
+    except OSError:
+        return False
+
+def cabrillo_files(path: str) -> list:
+    """Cabrillo logs of a directory, or the file itself"""
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, f) for f in os.listdir(path)
+                      if f.lower().endswith(CABRILLO_EXTENSIONS) and is_cabrillo(os.path.join(path, f)))
+    return [path] if is_cabrillo(path) else []
+
+def read_lines(path: str) -> tuple:
+    """Stream the log once: ({header tag: value}, [QSO: line contents])"""
+    header = {}
+    qsos = []
+    with open(path, encoding='latin-1') as f:
+        for line in f:
+            if line[:4].upper() == 'QSO:':
+                qsos.append(line[4:])
+                continue
+            tag, sep, value = line.partition(':')
+            if sep:
+                tag = tag.strip().upper()
+                # repeated tags (OPERATORS, SOAPBOX) continue the value
+                header[tag] = f'{header[tag]} {value.strip()}' if tag in header else value.strip()
+    return header, qsos
+
+def join_fields(fields: pd.DataFrame) -> pd.Series:
+    if fields.shape[1] == 0:
+        return pd.Series('', index=fields.index)
+    return fields.iloc[:, 0].str.cat([fields[c] for c in fields.columns[1:]], sep=' ')
+
+def tokenize(lines: list) -> pd.DataFrame:
+    """Split QSO: line contents into freq, mode, date, time, calls and exchanges.
+    Sent and received exchanges have the same number of fields, so an odd
+    number of fields after the time is a trailing transmitter id."""
+    tokens = pd.Series(lines, dtype=str).str.split(expand=True)
+    if tokens.shape[1] < 6:
+        return pd.DataFrame(columns=['Freq', 'Mode', 'Date', 'Time', 'StationCall', 'Snt', 'Call', 'Rcv', 'TX'])
+    counts = tokens.notna().sum(axis=1).to_numpy()
+    frames = []
+    for count in np.unique(counts):
+        if count < 6:
+            continue # malformed line
+        rows = tokens[counts == count]
+        half = (count - 4) // 2
+        sent = rows.iloc[:, 4:4 + half]
+        rcvd = rows.iloc[:, 4 + half:4 + 2 * half]
+        frames.append(pd.DataFrame({
+            'Freq': rows[0], 'Mode': rows[1], 'Date': rows[2], 'Time': rows[3],
+            'StationCall': sent.iloc[:, 0], 'Snt': join_fields(sent.iloc[:, 1:]),
+            'Call': rcvd.iloc[:, 0], 'Rcv': join_fields(rcvd.iloc[:, 1:]),
+            'TX': rows[count - 1] if (count - 4) % 2 else '0'}, index=rows.index))
+    return pd.concat(frames).sort_index() # back in log order
+
+def frequency_mhz(freq: pd.Series) -> np.ndarray:
+    """kHz on HF, band designators like 50, 144 or 1.2G in MHz above"""
+    giga = freq.str.upper().str.endswith('G')
+    values = pd.to_numeric(freq.str.rstrip('Gg'), errors='coerce').to_numpy(dtype=float)
+    values = np.where(giga, values * 1000, np.where(values >= 1000, values / 1000, values))
+    return np.nan_to_num(values)
+
+def contest_number(path: str) -> int:
+    """ContestNR of a log, stable while the file stays where it is"""
+    return zlib.crc32(os.path.abspath(path).encode()) & 0x7fffffff
+
+@instrument.timed()
+def parse_cabrillos(paths: list) -> list:
+    """Parse Cabrillo logs: [(header, DXLOG like frame indexed by TS)].
+    QSO lines of all logs are tokenized together, per log pandas overhead
+    would dominate otherwise. Cabrillo has no points, multipliers or run
+    flags: each QSO gets one point and is neither run nor multiplier."""
+    headers = []
+    lines = []
+    numbers = np.array([contest_number(path) for path in paths], dtype=np.int64)
+    owners = [np.zeros(0, dtype=np.int64)]
+    for i, path in enumerate(paths):
+        header, qso_lines = read_lines(path)
+        headers.append(header)
+        lines.extend(qso_lines)
+        owners.append(np.full(len(qso_lines), i))
+    tokens = tokenize(lines)
+    ts = pd.to_datetime(tokens.Date + ' ' + tokens.Time.str.zfill(4), format='%Y-%m-%d %H%M', errors='coerce')
+    mhz = frequency_mhz(tokens.Freq)
+    edge = np.searchsorted(BAND_EDGES, mhz, side='right') - 1
+    qsos = pd.DataFrame({
+        'TS': ts, 'ContestNR': numbers[np.concatenate(owners)[tokens.index]], 'Call': tokens.Call.str.upper(),
+        'Band': np.where(edge >= 0, BAND_EDGES[np.maximum(edge, 0)], 0.0), 'Freq': mhz * 1000,
+        'Mode': tokens.Mode.str.upper().map(MODES).fillna(tokens.Mode), 'Snt': tokens.Snt, 'Rcv': tokens.Rcv,
+        'Points': 1, 'IsMultiplier1': 0, 'IsMultiplier2': 0, 'IsMultiplier3': 0, 'IsRunQSO': 0,
+        'RadioNR': pd.to_numeric(tokens.TX, errors='coerce').fillna(0).astype(int) + 1,
+        'Continent': '', 'CountryPrefix': '', 'Sect': '', 'StationPrefix': tokens.StationCall.str.upper()})
+    qsos = compact_qsos(qsos[qsos.TS.notna()].set_index('TS'))
+    groups = dict(list(qsos.groupby('ContestNR', sort=False, observed=True)))
+    return [(header, groups.get(nr, qsos.iloc[0:0])) for header, nr in zip(headers, numbers)]
+
+def cache_path(directory: str) -> str:
+    return os.path.join(directory, PARSE_CACHE_DIR, 'cabrillo.pkl')
+
+def file_key(path: str) -> tuple:
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+def load_cache(directory: str) -> dict:
+    """{file name: (file key, header, qsos)} parsed before in the directory"""
+    try:
+        with open(cache_path(directory), 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, ValueError, AttributeError, ImportError, pickle.UnpicklingError):
+        return {}
+
+def save_cache(directory: str, parsed: dict):
+    path = cache_path(directory)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(parsed, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        pass # read-only directory, parse again next time
+
+def read_cabrillos(paths: list, max_workers: int = None, use_cache: bool = True) -> list:
+    """[(header, qsos)] of the logs. Logs are looked up in the parse cache of
+    their directory by name, mtime and size; the others are parsed, in a
+    process pool when there are many."""
+    caches = {}
+    parsed = [None] * len(paths)
+    for i, path in enumerate(paths):
+        directory, name = os.path.split(os.path.abspath(path))
+        if directory not in caches:
+            caches[directory] = load_cache(directory) if use_cache else {}
+        entry = caches[directory].get(name)
+        if entry is not None and entry[0] == file_key(path):
+            parsed[i] = entry[1:]
+    missing = [i for i, p in enumerate(parsed) if p is None]
+    if len(missing) == 0:
+        return parsed
+    keys = {i: file_key(paths[i]) for i in missing}
+    workers = max_workers or os.cpu_count() or 1
+    if len(missing) >= PARALLEL_MIN and workers > 1:
+        batches = [list(b) for b in np.array_split(missing, min(len(missing), 2 * workers))]
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            for batch, results in zip(batches, executor.map(parse_cabrillos, [[paths[i] for i in b] for b in batches])):
+                for i, result in zip(batch, results):
+                    parsed[i] = result
+    else:
+        for i, result in zip(missing, parse_cabrillos([paths[i] for i in missing])):
+            parsed[i] = result
+    if use_cache:
+        changed = set()
+        for i in missing:
+            directory, name = os.path.split(os.path.abspath(paths[i]))
+            caches[directory][name] = (keys[i],) + tuple(parsed[i])
+            changed.add(directory)
+        for directory in changed:
+            save_cache(directory, caches[directory])
+    return parsed
@@ -0,0 +1,303 @@
+"""Headless entry point: python -m cli report|compare|check|export DB [DB ...]"""
+import argparse
+import importlib.util
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from tabulate import tabulate
+import helpers as hl
+import instrument
+from LogSource import ARCHIVE_FORMATS, SQLLogSource, export_archive, open_source
+from StatsCache import open_cache
+from Workers import analyze_contests, batches, result_fingerprint, source_spec, traced_result
+from compare import COMPARE_METRICS, compare_curves
+from scp import file_version
+
+REPORT_ANALYSES = ['stats', 'performance frame 1 hours']
+FORMATS = ['text', 'csv', 'json', 'parquet']
+
+def select_contests(source, pattern=None, since=None, until=None) -> pd.DataFrame:
+    """Contests of the source filtered by name regex and start date range"""
+    contests = source.get_contests(sorted_by=['StartDate', 'ContestName'], dir='ASC')
+    if pattern:
+        contests = contests[contests.ContestName.str.contains(pattern, flags=re.IGNORECASE, regex=True)]
+    start = pd.to_datetime(contests.StartDate)
+    if since:
+        contests = contests[start >= pd.Timestamp(since)]
+    if until:
+        contests = contests[start < pd.Timestamp(until)]
+    return contests
+
+def compute_reports(files, pattern=None, since=None, until=None, jobs=None, use_cache=True, archive=False,
+                    analyses=REPORT_ANALYSES, scp_path=None, explain=False):
+    """Analyze the selected contests of all databases in a process pool
+        archive: databases aren't being logged to, read them immutable through an indexed copy
+        explain: log the queries that scan all of DXLOG, workers included
+        scp_path: super check partial file calls are checked against
+        return: {file: [(contest info row, {kind: result})]}"""
+    reports = {}
+    tasks = {}
+    caches = []
+    scp_version = file_version(scp_path) if scp_path else None
+    workers = jobs or os.cpu_count() or 1
+    with ProcessPoolExecutor(jobs) as executor:
+        for file in files:
+            source = open_source(file, immutable=archive, shadow_index=archive, explain=explain)
+            if not source.is_valid():
+                hl.log('ERROR', f'{file} Invalid')
+                continue
+            contests = select_contests(source, pattern, since, until)
+            cache = open_cache(file) if use_cache else None
+            if cache is not None:
+                caches.append(cache)
+            ids = [int(c) for c in contests.ContestNR]
+            fingerprints = source.get_contest_fingerprints(ids)
+            reports[file] = []
+            missing = {}
+            found = {}
+            for (_, info), contest_id in zip(contests.iterrows(), ids):
+                results = found[contest_id] = {}
+                for kind in analyses:
+                    value = None
+                    if cache:
+                        value = cache.get(contest_id, kind, result_fingerprint(kind, fingerprints[contest_id], scp_version))
+                    if value is not None:
+                        results[kind] = value
+                reports[file].append((info, results))
+                if any(kind not in results for kind in analyses):
+                    missing[contest_id] = [kind for kind in analyses if kind not in results]
+            # one query per batch of contests rather than a DXLOG scan per contest
+            for _, batch in batches(list(missing), workers, fingerprints):
+                batch_jobs = {contest_id: missing[contest_id] for contest_id in batch}
+                batch_fingerprints = {contest_id: fingerprints[contest_id] for contest_id in batch}
+                if instrument.enabled:
+                    future = executor.submit(instrument.traced_call, analyze_contests, source_spec(source),
+                                             batch_jobs, batch_fingerprints, scp_path=scp_path)
+                else:
+                    future = executor.submit(analyze_contests, source_spec(source), batch_jobs,
+                                             batch_fingerprints, scp_path=scp_path)
+                tasks[future] = (file, cache, {contest_id: found[contest_id] for contest_id in batch},
+                                 batch_fingerprints)
+            source.close()
+        for future in as_completed(tasks):
+            file, cache, found, fingerprints = tasks[future]
+            if future.exception() is not None:
+                hl.log('ERROR', f'{file}: contests {sorted(found)} failed: {future.exception()}')
+                continue
+            for contest_id, computed in traced_result(future.result()).items():
+                if isinstance(computed, Exception):
+                    hl.log('ERROR', f'{file}: contest {contest_id} failed: {computed}')
+                    continue
+                found[contest_id].update(computed)
+                if cache is not None:
+                    for kind, value in computed.items():
+                        cache.put(contest_id, kind, result_fingerprint(kind, fingerprints[contest_id], scp_version), value)
+    for cache in caches: # hits and results of a file are written in one transaction
+        cache.close()
+    return reports
+
+def all_time_stats(file, archive=False, explain=False):
+    """Stats of every QSO of the log, streamed in time ordered chunks in bounded memory, None if it can't be opened"""
+    source = open_source(file, immutable=archive, shadow_index=archive, explain=explain)
+    try:
+        if not source.is_valid():
+            return None
+        with instrument.span('all time stats', file=file):
+            return hl.generate_stats_from_chunks(source.iter_contest_qsos(columns=hl.STATS_COLUMNS))
+    finally:
+        source.close()
+
+def summary_frame(file, contests) -> pd.DataFrame:
+    """One row of stats per contest"""
+    rows = []
+    for info, results in contests:
+        if 'stats' not in results:
+            continue
+        row = {'Database': os.path.basename(file), 'ContestNR': int(info['ContestNR']),
+               'ContestName': info['ContestName'], 'Date': info['StartDate'],
+               'Power category': info.get('PowerCategory', '')}
+        row.update(hl.flat_stats(results['stats']))
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def performance_table(contests) -> pd.DataFrame:
+    """Performance tables of all contests stacked with a ContestNR column"""
+    frames = []
+    for info, results in contests:
+        frame = results.get('performance frame 1 hours')
+        if frame is None or len(frame) == 0:
+            continue
+        frames.append(frame.reset_index().assign(ContestNR=int(info['ContestNR'])))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def write_report(file, contests, output, fmt):
+    stem = os.path.join(output, os.path.splitext(os.path.basename(file))[0])
+    summary = summary_frame(file, contests)
+    performance = performance_table(contests)
+    if fmt == 'text':
+        with open(f'{stem}_stats.txt', 'w') as f:
+            f.write("SUMMARY\n\n")
+            if len(summary):
+                table = summary.set_index('ContestName').T.rename_axis('Statistics').reset_index()
+                f.write(tabulate(table, headers='keys', tablefmt="grid", showindex=False))
+            f.write("\n\n\n")
+            for contest_id, frame in performance.groupby('ContestNR', sort=False) if len(performance) else []:
+                frame = frame.drop(columns='ContestNR')
+                frame['Slot'] = frame.Slot.map(hl.get_hours)
+                f.write(f"PERFORMANCE {contest_id}\n\n")
+                f.write(tabulate(frame, headers='keys', tablefmt="grid", showindex=False))
+                f.write("\n\n\n")
+    elif fmt == 'csv':
+        summary.to_csv(f'{stem}_summary.csv', index=False)
+        performance.to_csv(f'{stem}_performance.csv', index=False)
+    elif fmt == 'json':
+        with open(f'{stem}.json', 'w') as f:
+            json.dump({'summary': summary.to_dict('records'),
+                       'performance': json.loads(performance.to_json(orient='records', date_format='iso'))},
+                      f, indent=1, default=str)
+    elif fmt == 'parquet':
+        summary.to_parquet(f'{stem}_summary.parquet', index=False)
+        performance.to_parquet(f'{stem}_performance.parquet', index=False)
+
+def report(args):
+    if args.format == 'parquet' and not any(importlib.util.find_spec(m) for m in ('pyarrow', 'fastparquet')):
+        hl.log('ERROR', 'parquet output requires pyarrow')
+        return 2
+    os.makedirs(args.output, exist_ok=True)
+    reports = compute_reports(args.files, args.contest, args.since, args.until, args.jobs,
+                              use_cache=not args.no_cache, archive=args.archive, explain=args.explain)
+    for file, contests in reports.items():
+        count = len(contests)
+        if args.all_time:
+            stats = all_time_stats(file, archive=args.archive, explain=args.explain)
+            if stats is not None:
+                contests = contests + [({'ContestNR': 0, 'ContestName': 'All contests', 'StartDate': ''},
+                                        {'stats': stats})]
+        write_report(file, contests, args.output, args.format)
+        hl.log('INFO', f'{file}: {count} contests reported')
+    return 0 if reports else 1
+
+def compare(args):
+    """Selected contests of all databases aligned on hours since start, one csv per metric"""
+    reports = compute_reports(args.files, args.contest, args.since, args.until, args.jobs,
+                              use_cache=not args.no_cache, analyses=['curve 1 hours'], explain=args.explain)
+    curves = {}
+    for file, contests in reports.items():
+        for info, results in contests:
+            if 'curve 1 hours' in results:
+                label = f"{info['ContestName']} {str(info['StartDate'])[:10]} {os.path.basename(file)}"
+                curves[label] = results['curve 1 hours']
+    if len(curves) == 0:
+        hl.log('ERROR', 'No contests to compare')
+        return 1
+    table = compare_curves(curves)
+    os.makedirs(args.output, exist_ok=True)
+    for metric in args.metrics:
+        path = os.path.join(args.output, f"compare_{metric.replace(' ', '_').lower()}.csv")
+        table.xs(metric, axis=1, level=1).to_csv(path)
+    hl.log('INFO', f'{len(curves)} contests compared')
+    return 0
+
+def check(args):
+    """Dupes and likely busted calls of the selected contests, one csv per database"""
+    if not os.path.exists(args.scp):
+        hl.log('INFO', f'{args.scp} not found, checking dupes only')
+    reports = compute_reports(args.files, args.contest, args.since, args.until, args.jobs,
+                              analyses=['check'], scp_path=args.scp, explain=args.explain)
+    os.makedirs(args.output, exist_ok=True)
+    for file, contests in reports.items():
+        frames = [results['check'].reset_index().assign(ContestNR=int(info['ContestNR']))
+                  for info, results in contests if 'check' in results]
+        table = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        stem = os.path.join(args.output, os.path.splitext(os.path.basename(file))[0])
+        table.to_csv(f'{stem}_check.csv', index=False)
+        counts = table.Issue.value_counts().to_dict() if len(table) else {}
+        hl.log('INFO', f"{file}: {len(contests)} contests checked, " +
+               (', '.join(f'{n} {issue}' for issue, n in counts.items()) or 'no issues'))
+    return 0 if reports else 1
+
+def export(args):
+    if not any(importlib.util.find_spec(m) for m in ('pyarrow',)):
+        hl.log('ERROR', 'archives require pyarrow')
+        return 2
+    failed = 0
+    for file in args.files:
+        source = SQLLogSource(files=[file])
+        if not source.is_valid():
+            hl.log('ERROR', f'{file} Invalid')
+            failed += 1
+            continue
+        ids = [int(c) for c in select_contests(source, args.contest, args.since, args.until).ContestNR]
+        source.close()
+        archive_dir = os.path.join(args.output, os.path.splitext(os.path.basename(file))[0])
+        written = export_archive(file, archive_dir, ids, args.format)
+        hl.log('INFO', f'{file}: {len(written)} of {len(ids)} contests written to {archive_dir}')
+    return 1 if failed else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='cli', description='N1MM+ log analyzer without UI')
+    parser.add_argument('--trace', metavar='FILE', help='write timing spans as a Chrome trace file')
+    parser.add_argument('--profile', action='store_true', help='with --trace, cProfile the command into a .prof file')
+    parser.add_argument('--explain', action='store_true', help='log the SQL queries that scan all of DXLOG')
+    commands = parser.add_subparsers(dest='command', required=True)
+    cmd = commands.add_parser('report', help='write stats and performance tables')
+    cmd.add_argument('files', nargs='+', help='N1MM+ databases (.s3db), archives or Cabrillo logs/directories')
+    cmd.add_argument('--contest', help='contest name regular expression')
+    cmd.add_argument('--since', help='first contest start date')
+    cmd.add_argument('--until', help='contests starting before this date')
+    cmd.add_argument('--format', choices=FORMATS, default='text')
+    cmd.add_argument('--output', default='.', help='output directory')
+    cmd.add_argument('--jobs', type=int, default=None, help='worker processes')
+    cmd.add_argument('--no-cache', action='store_true', help='ignore and do not update stats caches')
+    cmd.add_argument('--archive', action='store_true',
+                     help='databases are closed archives: read them through an indexed copy (.index)')
+    cmd.add_argument('--all-time', action='store_true',
+                     help='add an "All contests" summary of every QSO of each log, streamed in bounded memory')
+    cmd.set_defaults(func=report)
+    cmd = commands.add_parser('compare', help='contests aligned on hours since their start, deltas to the first')
+    cmd.add_argument('files', nargs='+', help='N1MM+ databases (.s3db), archives or Cabrillo logs/directories')
+    cmd.add_argument('--contest', help='contest name regular expression')
+    cmd.add_argument('--since', help='first contest start date')
+    cmd.add_argument('--until', help='contests starting before this date')
+    cmd.add_argument('--metrics', nargs='+', choices=COMPARE_METRICS, default=COMPARE_METRICS)
+    cmd.add_argument('--output', default='.', help='output directory')
+    cmd.add_argument('--jobs', type=int, default=None, help='worker processes')
+    cmd.add_argument('--no-cache', action='store_true', help='ignore and do not update stats caches')
+    cmd.set_defaults(func=compare)
+    cmd = commands.add_parser('check', help='dupes and calls not in the super check partial file')
+    cmd.add_argument('files', nargs='+', help='N1MM+ databases (.s3db), archives or Cabrillo logs/directories')
+    cmd.add_argument('--scp', default='MASTER.SCP', help='super check partial file')
+    cmd.add_argument('--contest', help='contest name regular expression')
+    cmd.add_argument('--since', help='first contest start date')
+    cmd.add_argument('--until', help='contests starting before this date')
+    cmd.add_argument('--output', default='.', help='output directory')
+    cmd.add_argument('--jobs', type=int, default=None, help='worker processes')
+    cmd.set_defaults(func=check)
+
+    cmd = commands.add_parser('export', help='archive contests as columnar files, one directory per database')
+    cmd.add_argument('files', nargs='+', help='N1MM+ databases (.s3db)')
+    cmd.add_argument('--contest', help='contest name regular expression')
+    cmd.add_argument('--since', help='first contest start date')
+    cmd.add_argument('--until', help='contests starting before this date')
+    cmd.add_argument('--format', choices=ARCHIVE_FORMATS, default='feather',
+                     help='feather is memory mapped when read, parquet is smaller')
+    cmd.add_argument('--output', default='.', help='directory of the archives')
+    cmd.set_defaults(func=export)
+    args = parser.parse_args(argv)
+    if args.trace:
+        instrument.enable(args.trace, profile_last=1 if args.profile else 0)
+    with instrument.operation(args.command):
+        status = args.func(args)
+    if instrument.enabled:
+        hl.log('INFO', instrument.format_breakdown(instrument.last_operation()))
+        path = instrument.export_trace()
+        hl.log('INFO', f'Trace written to {path}')
+        for path in instrument.dump_profiles(os.path.dirname(os.path.abspath(path))):
+            hl.log('INFO', f'Profile written to {path}')
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""Contests compared on hours since their start.
+
+Each contest is reduced to a small per bucket curve (contest_curve, computed
+where the QSOs are), so comparing many contests costs buckets x contests
+memory, not QSOs."""
+import numpy as np
+import pandas as pd
+import helpers as hl
+import instrument
+
+CURVE_COLUMNS = ['QSOs', 'Mults', 'Points'] # per bucket sums of contest_curve
+COMPARE_METRICS = ['QSOs', 'Mults', 'Score', 'Rate', 'Rate delta']
+HOUR = pd.Timedelta(hours=1).value
+
+@instrument.timed()
+def contest_curve(df, start=None, bucket=pd.Timedelta(hours=1)):
+    """ QSOs, mults and points per bucket since the contest start
+        start: StartDate of the contest, the round hour of the first QSO when None;
+               QSOs before it count in the first bucket
+        return: int64 array of (buckets, CURVE_COLUMNS)"""
+    if len(df) == 0:
+        return np.zeros((0, len(CURVE_COLUMNS)), dtype=np.int64)
+    ts = hl.timestamps_ns(df.index)
+    if start is None:
+        first = ts.min()
+        origin = first - first % HOUR
+    else:
+        origin = hl.timestamps_ns([pd.Timestamp(start)])[0]
+    slots = np.maximum(ts - origin, 0) // pd.Timedelta(bucket).value
+    mults = df.IsMultiplier1.to_numpy(dtype=np.int64) + df.IsMultiplier2.to_numpy(dtype=np.int64)
+    points = df.Points.to_numpy(dtype=np.int64)
+    size = int(slots.max()) + 1
+    return np.column_stack([np.bincount(slots, minlength=size),
+                            np.bincount(slots, weights=mults, minlength=size),
+                            np.bincount(slots, weights=points, minlength=size)]).astype(np.int64)
+
+def compare_curves(curves, bucket=pd.Timedelta(hours=1), reference=0):
+    """ Align contest curves on their start and derive the comparison metrics in one pass
+        curves: {label: contest_curve}
+        reference: position of the contest the rate deltas are taken against
+        return: DataFrame indexed by hours since start, (label, COMPARE_METRICS) columns
+                with cumulative QSOs, mults and score, QSOs per hour and its delta"""
+    labels = list(curves)
+    if len(labels) == 0:
+        return pd.DataFrame()
+    length = max(len(curve) for curve in curves.values())
+    stack = np.zeros((len(labels), length, len(CURVE_COLUMNS)), dtype=np.int64)
+    for i, curve in enumerate(curves.values()):
+        stack[i, :len(curve)] = curve
+    total = stack.cumsum(axis=1)
+    rate = stack[:, :, 0] * (HOUR / pd.Timedelta(bucket).value)
+    metrics = np.stack([total[:, :, 0], total[:, :, 1], total[:, :, 2] * total[:, :, 1],
+                        rate, rate - rate[reference]], axis=2)
+    hours = pd.Index(np.arange(length) * (pd.Timedelta(bucket).value / HOUR), name='Hour')
+    columns = pd.MultiIndex.from_product([labels, COMPARE_METRICS])
+    return pd.DataFrame(metrics.transpose(1, 0, 2).reshape(length, -1), index=hours, columns=columns)
@@ -1,133 +1,379 @@
 import numpy as np
 import pandas as pd
 from datetime import datetime
+import instrument
+import mults
 
 def show_stats(dict):
     for key, val in dict.items():
         print(f'{key}: {val}')
 
-def windowed_count(ts, window, stats):
-    e_idx = 0
-    counts = np.zeros(shape=ts.shape)
-    for i, st in enumerate(ts):
-        et = st + window
-        while (e_idx < stats['Total QSOs']) and (ts[e_idx] <= et):
-            e_idx += 1
-            counts[i] += 1
-        if i < len(counts) - 1:
-            counts[i+1] = counts[i] - 1
-    return int(max(counts)), (counts == max(counts)).sum(), counts
-
-def generate_stats(df):
-    """ Generate statistics from DXLOG frame """
-    stats = {}
-    stats['Total QSOs'] = len(df)
-    if stats['Total QSOs'] == 0:
+RATE_WINDOWS = (10, 30, 60) # rate window sizes in minutes
+
+# DXLOG columns (besides the TS index) used by the analysis functions
+STATS_COLUMNS = ['Points', 'IsMultiplier1', 'IsMultiplier2', 'IsRunQSO',
+                 'Continent', 'CountryPrefix', 'Sect', 'RadioNR']
+PERFORMANCE_COLUMNS = ['Band', 'IsRunQSO', 'IsMultiplier1', 'IsMultiplier2']
+QSO_COLUMNS = list(dict.fromkeys(STATS_COLUMNS + PERFORMANCE_COLUMNS))
+
+def timestamps_ns(index):
+    """ Convert datetime index or array to int64 nanoseconds since epoch """
+    return np.asarray(index, dtype='datetime64[ns]').view(np.int64)
+
+# minimum off time in minutes by contest name prefix (compared without blanks and dashes)
+OFF_TIME_RULES = {'CQWW': 60, 'CQWPX': 60}
+DEFAULT_OFF_TIME = 30
+
+def min_off_time(contest_name):
+    """ Shortest gap between QSOs that counts as off time under the contest rules """
+    name = ''.join(c for c in str(contest_name).upper() if c.isalnum())
+    minutes = next((m for prefix, m in OFF_TIME_RULES.items() if name.startswith(prefix)), DEFAULT_OFF_TIME)
+    return pd.Timedelta(minutes=minutes)
+
+def off_times(ts, min_off=pd.Timedelta(minutes=DEFAULT_OFF_TIME)):
+    """ Breaks (gaps longer than min_off) and on-time periods of sorted int64 ns timestamps
+        return: (breaks, on_times), int64 arrays of [start, end] rows"""
+    ts = np.asarray(ts, dtype=np.int64)
+    if len(ts) == 0:
+        return np.zeros((0, 2), dtype=np.int64), np.zeros((0, 2), dtype=np.int64)
+    gaps = np.flatnonzero(np.diff(ts) > pd.Timedelta(min_off).value)
+    breaks = np.column_stack([ts[gaps], ts[gaps + 1]])
+    on_times = np.column_stack([np.concatenate([ts[:1], ts[gaps + 1]]), np.concatenate([ts[gaps], ts[-1:]])])
+    return breaks, on_times
+
+def off_time_frame(breaks, on_times, on_qsos):
+    """ On-time periods and the breaks between them in time order
+        return: DataFrame with Kind ('On'/'Off'), Start, End, Duration, QSOs and Rate columns.
+        An on period lasts to the end of the minute of its last QSO, Rate is QSOs per on-time hour."""
+    n = len(on_times) + len(breaks)
+    starts = np.zeros(n, dtype=np.int64)
+    ends = np.zeros(n, dtype=np.int64)
+    starts[0::2], ends[0::2] = on_times[:, 0], on_times[:, 1]
+    starts[1::2], ends[1::2] = breaks[:, 0], breaks[:, 1]
+    on = np.arange(n) % 2 == 0
+    durations = ends - starts + np.where(on, pd.Timedelta(minutes=1).value, 0)
+    qsos = np.zeros(n, dtype=np.int64)
+    qsos[0::2] = on_qsos
+    return pd.DataFrame({'Kind': np.where(on, 'On', 'Off'),
+                         'Start': pd.to_datetime(starts), 'End': pd.to_datetime(ends),
+                         'Duration': pd.to_timedelta(durations),
+                         'QSOs': qsos, 'Rate': np.round(qsos * 3600e9 / durations, 1)})
+
+@instrument.timed()
+def generate_off_times(df, min_off=pd.Timedelta(minutes=DEFAULT_OFF_TIME)):
+    """ Breaks and on-time periods of a DXLOG frame, see off_time_frame """
+    ts = np.sort(timestamps_ns(df.index))
+    breaks, on_times = off_times(ts, min_off)
+    on_qsos = np.searchsorted(ts, on_times[:, 1], side='right') - np.searchsorted(ts, on_times[:, 0], side='left')
+    return off_time_frame(breaks, on_times, on_qsos)
+
+def windowed_counts(ts, windows, start=0, stop=None):
+    """ Count QSOs in a window starting at every QSO, for all window sizes at once
+        ts: sorted int64 nanosecond timestamps
+        windows: iterable of window sizes (pd.Timedelta or anything it accepts)
+        start, stop: count only the windows starting at QSOs start..stop
+        return: {window: (max count, max count repeats, counts)}"""
+    ts = np.asarray(ts, dtype=np.int64)
+    windows = list(windows)
+    stop = len(ts) if stop is None else stop
+    if stop <= start:
+        return {w: (0, 0, np.zeros(0, dtype=np.int64)) for w in windows}
+    widths = np.array([pd.Timedelta(w).value for w in windows], dtype=np.int64)
+    # one searchsorted over (windows x qsos) window end points
+    ends = np.searchsorted(ts, ts[np.newaxis, start:stop] + widths[:, np.newaxis], side='right')
+    all_counts = ends - np.arange(start, stop)
+    result = {}
+    for w, counts in zip(windows, all_counts):
+        peak = int(counts.max())
+        result[w] = (peak, int((counts == peak).sum()), counts)
+    return result
+
+def windowed_count(ts, window, stats=None):
+    """ Count QSOs in a window starting at every QSO
+        return: (max count, max count repeats, counts)"""
+    if not np.issubdtype(np.asarray(ts).dtype, np.integer):
+        ts = timestamps_ns(ts)
+    return windowed_counts(ts, [window])[window]
+
+def window_rate(count, minutes):
+    """ Scale QSO count in a window of minutes to QSOs per hour """
+    rate = count * 60 / minutes
+    return int(rate) if rate.is_integer() else round(rate, 1)
+
+class StatsAccumulator:
+    """ Statistics of a DXLOG frame fed in time ordered chunks.
+        Memory is bounded by the QSOs of the longest rate window unless keep_counts is set."""
+    def __init__(self, rate_windows=RATE_WINDOWS, keep_counts=False,
+                 break_time=pd.Timedelta(minutes=DEFAULT_OFF_TIME)):
+        self.rate_windows_ = list(rate_windows)
+        self.widths_ = [pd.Timedelta(minutes=m).value for m in self.rate_windows_]
+        self.keep_counts_ = keep_counts
+        self.break_time_ = pd.Timedelta(break_time).value
+        self.total_ = 0
+        self.points_ = 0
+        self.mults_ = 0
+        self.run_ = 0
+        self.entities_ = mults.MultAccumulator() # continents, countries, sections and QSOs per radio
+        self.first_ = None # ns timestamps
+        self.last_ = None
+        self.break_total_ = 0
+        self.breaks_ = [np.zeros((0, 2), dtype=np.int64)]
+        self.on_qsos_ = [] # QSOs per on-time period
+        # window counts are final once the window is closed by a later QSO; tail_ keeps the open ones
+        self.tail_ = np.zeros(0, dtype=np.int64)
+        self.done_ = [0] * len(self.widths_)
+        self.peaks_ = [0] * len(self.widths_)
+        self.repeats_ = [0] * len(self.widths_)
+        self.counts_ = [[] for _ in self.widths_]
+
+    @instrument.timed('StatsAccumulator.update')
+    def update(self, df):
+        """ Add a chunk of QSOs, all of them not earlier than the previous chunk """
+        if len(df) == 0:
+            return
+        ts = timestamps_ns(df.index)
+        if np.any(ts[1:] < ts[:-1]) or (self.last_ is not None and ts[0] < self.last_):
+            raise ValueError("QSO chunks must be time ordered")
+        self.total_ += len(df)
+        self.points_ += int(df['Points'].sum())
+        self.mults_ += int(df['IsMultiplier1'].sum()) + int(df['IsMultiplier2'].sum())
+        self.run_ += int(df['IsRunQSO'].sum())
+        self.entities_.update(df, ts)
+
+        # operating time is the whole span less the gaps longer than break_time
+        joined = ts if self.last_ is None else np.concatenate([[self.last_], ts])
+        gaps = np.flatnonzero(np.diff(joined) > self.break_time_)
+        self.breaks_.append(np.column_stack([joined[gaps], joined[gaps + 1]]))
+        self.break_total_ += int((joined[gaps + 1] - joined[gaps]).sum())
+        # QSOs of the chunk per on period, the first part continues the current period
+        starts = gaps + (1 if self.last_ is None else 0)
+        sizes = np.diff(np.concatenate([[0], starts, [len(ts)]])).tolist()
+        if self.on_qsos_:
+            self.on_qsos_[-1] += sizes.pop(0)
+        self.on_qsos_ += sizes
+        if self.first_ is None:
+            self.first_ = int(ts[0])
+        self.last_ = int(ts[-1])
+
+        ts = np.concatenate([self.tail_, ts])
+        final = [int(np.searchsorted(ts, ts[-1] - width, side='left')) for width in self.widths_]
+        self.fold_counts(ts, self.done_, final, self.peaks_, self.repeats_, self.keep_counts_)
+        self.done_ = final
+        drop = min(self.done_)
+        self.tail_ = ts[drop:]
+        self.done_ = [d - drop for d in self.done_]
+
+    def fold_counts(self, ts, starts, stops, peaks, repeats, keep):
+        """ Merge window counts of QSOs starts[w]..stops[w] into peaks and repeats of every window w,
+            all windows counted by one windowed_counts """
+        lo, hi = min(starts), max(stops)
+        counted = windowed_counts(ts, self.widths_, lo, hi)
+        for w, width in enumerate(self.widths_):
+            counts = counted[width][2][starts[w] - lo:stops[w] - lo]
+            if len(counts) == 0:
+                continue
+            peak = int(counts.max())
+            if peak > peaks[w]:
+                peaks[w], repeats[w] = peak, int((counts == peak).sum())
+            elif peak == peaks[w]:
+                repeats[w] += int((counts == peak).sum())
+            if keep:
+                self.counts_[w].append(counts)
+
+    def operating_time(self):
+        return pd.Timedelta(minutes=1) + pd.Timedelta(self.last_ - self.first_ - self.break_total_)
+
+    def off_times(self):
+        """ (breaks, on_times) of all QSOs added so far, as returned by off_times """
+        breaks = np.concatenate(self.breaks_)
+        if self.first_ is None:
+            return breaks, np.zeros((0, 2), dtype=np.int64)
+        on_times = np.column_stack([np.concatenate([[self.first_], breaks[:, 1]]),
+                                    np.concatenate([breaks[:, 0], [self.last_]])])
+        return breaks, on_times
+
+    def off_time_frame(self):
+        return off_time_frame(*self.off_times(), self.on_qsos_)
+
+    def stats(self):
+        """ Statistics of all QSOs added so far, same keys as generate_stats """
+        stats = {}
+        stats['Total QSOs'] = self.total_
+        if self.total_ == 0:
+            return stats
+        stats['Claimed points'] = self.points_
+        stats['Claimed mults'] = self.mults_
+        stats['Claimed score'] = self.mults_ * self.points_
+        total_op_time = self.operating_time()
+        stats['Operating Time'] = total_op_time
+        stats['Average Rate'] = round(float(self.total_)/total_op_time.total_seconds()*3600, 1)
+        # windows still open at the last QSO are counted without touching the accumulated state
+        peaks, repeats = list(self.peaks_), list(self.repeats_)
+        self.fold_counts(self.tail_, self.done_, [len(self.tail_)] * len(self.widths_), peaks, repeats, False)
+        for w, minutes in enumerate(self.rate_windows_):
+            stats[f'{minutes} min Rate'] = window_rate(peaks[w], minutes)
+            stats[f'{minutes} min Rate repeats'] = repeats[w]
+        stats['Run QSOs percent'] = round(float(self.run_)/self.total_*100, 1)
+        stats.update(self.entities_.counts())
+        stats['QSOs per Radios'] = {int(r): int(q) for r, q in self.entities_.breakdown('radio').QSOs.items()}
+        return stats
+
+    def counts(self):
+        """ Window counts per QSO for every rate window, requires keep_counts """
+        result = []
+        lo = min(self.done_)
+        counted = windowed_counts(self.tail_, self.widths_, lo)
+        for w, width in enumerate(self.widths_):
+            tail = counted[width][2][self.done_[w] - lo:]
+            result.append(np.concatenate(self.counts_[w] + [tail]).astype(np.int64))
+        return result
+
+@instrument.timed()
+def generate_stats(df, rate_windows=RATE_WINDOWS, min_off=pd.Timedelta(minutes=DEFAULT_OFF_TIME)):
+    """ Generate statistics from DXLOG frame
+        rate_windows: rate window sizes in minutes
+        min_off: shortest break, see min_off_time
+        return: (stats, counts per window for every rate window)"""
+    if len(df) == 0:
         print('Empty data frame')
-        return stats, None, None, None
-    df = df.sort_index()
-    stats['Claimed points'] = df['Points'].sum()
-    stats['Claimed mults'] = df['IsMultiplier1'].sum() + df['IsMultiplier2'].sum()
-    stats['Claimed score'] = stats['Claimed mults'] * stats['Claimed points']
-
-    # calculate total operating time
-    ts = np.array(df.index.to_list())
-    dts = ts[1:] - ts[:-1]
-    br_ts = []
-    op_times = []
-    start_time = ts[0]
-    total_op_time = pd.Timedelta(minutes=1)
-    for t, dt in zip(ts[1:], dts):
-        if dt <= pd.Timedelta(minutes=30):
-            prev = t
-            continue
-        br_ts.append((prev, t))
-        op_times.append((start_time, prev))
-        total_op_time += (prev - start_time)
-        start_time = t
-        prev = t
-    op_times.append((start_time, ts[-1]))
-    total_op_time += ts[-1] - start_time
-    stats['Operating Time'] = total_op_time
-
-    # calculate rates
-    stats['Average Rate'] = round(float(stats['Total QSOs'])/total_op_time.total_seconds()*3600, 1)
-    window = pd.Timedelta(minutes=10) # in minutes
-    q_count, repeats, counts_10min = windowed_count(ts=ts, window=window, stats=stats)
-    stats['10 min Rate'] = q_count * 6
-    stats['10 min Rate repeats'] = repeats
-
-    window = pd.Timedelta(minutes=30) # in minutes
-    q_count, repeats, counts_30min = windowed_count(ts=ts, window=window, stats=stats)
-    stats['30 min Rate'] = q_count * 2
-    stats['30 min Rate repeats'] = repeats
-
-    window = pd.Timedelta(minutes=60) # in minutes
-    q_count, repeats, counts_60min = windowed_count(ts=ts, window=window, stats=stats)
-    stats['60 min Rate'] = q_count
-    stats['60 min Rate repeats'] = repeats
-
-    # calculate running 
-    stats['Run QSOs percent'] = round(float(sum(df['IsRunQSO']))/stats['Total QSOs']*100, 1)
-    dummy = set(df.Continent.to_list())
-    dummy.discard('')
-    dummy.discard(' ')
-    stats['Continents'] = len(dummy)
-    dummy = set(df.CountryPrefix.to_list())
-    dummy.discard('')
-    dummy.discard(' ')
-    stats['Countries'] = len(dummy)
-    dummy = set(df.Sect.to_list())
-    dummy.discard('')
-    dummy.discard(' ')
-    stats['Sections'] = len(dummy)
-    # radios
-    stats['QSOs per Radios'] = {r: int((df['RadioNR'] == r).sum()) for r in set(df.RadioNR.to_list())}
-    
-    return stats, counts_10min, counts_30min, counts_60min
+        return ({'Total QSOs': 0},) + (None,) * len(rate_windows)
+    accumulator = StatsAccumulator(rate_windows, keep_counts=True, break_time=min_off)
+    accumulator.update(df.sort_index())
+    return (accumulator.stats(), *accumulator.counts())
+
+@instrument.timed()
+def generate_contest_stats(df, rate_windows=RATE_WINDOWS, min_off=pd.Timedelta(minutes=DEFAULT_OFF_TIME)):
+    """ Statistics of a DXLOG frame as generate_stats, without the counts per window """
+    accumulator = StatsAccumulator(rate_windows, break_time=min_off)
+    accumulator.update(df.sort_index())
+    return accumulator.stats()
+
+@instrument.timed()
+def generate_summary(df, min_off=pd.Timedelta(minutes=DEFAULT_OFF_TIME)):
+    """ One line summary of a contest for the contest list """
+    if len(df) == 0:
+        return {'QSOs': 0}
+    accumulator = StatsAccumulator(rate_windows=(10, 60), break_time=min_off)
+    accumulator.update(df.sort_index())
+    stats = accumulator.stats()
+    return {'QSOs': stats['Total QSOs'], 'Score': stats['Claimed score'],
+            'FirstTS': str(pd.Timestamp(accumulator.first_)), 'LastTS': str(pd.Timestamp(accumulator.last_)),
+            'Hours': round(stats['Operating Time'].total_seconds() / 3600, 1),
+            'Rate10': stats['10 min Rate'], 'Rate60': stats['60 min Rate']}
+
+@instrument.timed()
+def generate_stats_from_chunks(chunks, rate_windows=RATE_WINDOWS, min_off=pd.Timedelta(minutes=DEFAULT_OFF_TIME)):
+    """ Generate statistics from time ordered chunks of DXLOG frame in bounded memory """
+    accumulator = StatsAccumulator(rate_windows, break_time=min_off)
+    for chunk in chunks:
+        accumulator.update(chunk)
+    return accumulator.stats()
+
+BANDS = {1.8: '160', 3.5: '80', 7.0: '40', 14.0: '20', 21.0: '15', 28.0: '10'} # MHz: band name
+
+class PerformanceAccumulator:
+    """ Per interval and per band QSO counts of a DXLOG frame fed in time ordered chunks.
+        Intervals are aligned on the round hour of the first QSO."""
+    def __init__(self, increment : int, increment_unit : str):
+        if increment_unit not in ['minutes', 'hours']:
+            raise ValueError("Unit must be minute or hour")
+        self.increment_ = pd.Timedelta(**{increment_unit: increment})
+        self.start_ = None
+        self.last_ = None
+        self.total_ = 0
+        self.counts_ = None # raw counts per interval start
 
+    @instrument.timed('PerformanceAccumulator.update')
+    def update(self, df):
+        """ Add a chunk of QSOs, none of them earlier than the first chunk """
+        if len(df) == 0:
+            return
+        bands = df[['Band', 'IsRunQSO', 'IsMultiplier1', 'IsMultiplier2']]
+        if self.start_ is None:
+            self.start_ = bands.index.min().floor("h") #roundinig ts
+        elif bands.index.min() < self.start_:
+            raise ValueError("QSO chunks must be time ordered")
+        last = bands.index.max()
+        self.last_ = last if self.last_ is None else max(self.last_, last)
+        self.total_ += len(bands)
+
+        # bin every QSO once, then count band x run and mults per bin
+        qsos = pd.DataFrame({'Slot': self.start_ + (bands.index - self.start_).floor(self.increment_),
+                             'Band': bands.Band.astype('float64').round(1).map(BANDS).to_numpy(),
+                             'Run': bands.IsRunQSO.astype(bool).to_numpy(),
+                             'Mult': (bands.IsMultiplier1.astype(bool) | bands.IsMultiplier2.astype(bool)).to_numpy()})
+        per_band = qsos.groupby(['Slot', 'Band'])['Run'].agg(['size', 'sum']).unstack('Band', fill_value=0)
+        per_band = per_band.reindex(columns=pd.MultiIndex.from_product([['size', 'sum'], BANDS.values()]),
+                                    fill_value=0)
+        per_band.columns = list(BANDS.values()) + [f'{b} Run' for b in BANDS.values()]
+        totals = qsos.groupby('Slot').agg(Mults=('Mult', 'sum'), QSOs=('Run', 'size'), Run=('Run', 'sum'))
+        counts = per_band.join(totals).astype(np.int64)
+        if self.counts_ is None:
+            self.counts_ = counts
+        else:
+            self.counts_ = self.counts_.add(counts, fill_value=0).astype(np.int64)
+
+    def frame(self):
+        """ DataFrame indexed by interval start with QSOs and run QSOs per band,
+            Mults, QSOs, Run % and Pct (percent of all QSOs) columns"""
+        if self.total_ == 0:
+            return pd.DataFrame()
+        end_date = self.last_.ceil("h")
+        intervals = pd.date_range(self.start_, end_date - self.increment_, freq=self.increment_)
+        frame = self.counts_.reindex(intervals, fill_value=0)
+        # python round() per interval keeps the decimal rounding of the original table
+        frame['Run %'] = [round(100.0 * r / (q + 0.001)) for r, q in zip(frame.pop('Run'), frame.QSOs)]
+        frame['Pct'] = [round(100.0 * q / self.total_, 1) for q in frame.QSOs]
+        frame.index.name = 'Slot'
+        return frame
+
+    def data(self):
+        """ Performance table in the generate_pefromance_data shape """
+        return performance_data(self.frame())
+
+@instrument.timed()
+def performance_frame(df, increment : int, increment_unit : str):
+    """ Generate performance per interval and per band from DXLOG frame
+        return: DataFrame indexed by interval start with QSOs and run QSOs per band,
+                Mults, QSOs, Run % and Pct (percent of all QSOs) columns"""
+    if len(df) == 0:
+        print('Empty data frame')
+        return pd.DataFrame()
+    accumulator = PerformanceAccumulator(increment, increment_unit)
+    accumulator.update(df)
+    return accumulator.frame()
+
+@instrument.timed()
+def performance_data(frame):
+    """ Convert performance frame to {ts: (per band (QSOs, run QSOs), mults, QSOs, run %, pct)} """
+    stats = {}
+    names = list(BANDS.values())
+    for s, row in zip(frame.index, frame.to_dict('records')):
+        stats[s] = tuple((row[b], row[f'{b} Run']) for b in names) + \
+                   (row['Mults'], row['QSOs'], row['Run %'], row['Pct'])
+    return stats
+
+@instrument.timed()
 def generate_pefromance_data(df, increment : int, increment_unit : str):
     """ Generate performance per hour and per band from DXLOG frame 
         return: {ts, 160, 80, 40, 20, 15, 10, interval count, percent per interval}"""
-    stats = {}
-    bands = df[['Band', 'IsRunQSO', 'IsMultiplier1', 'IsMultiplier2']].sort_index() # select ts and band and sort it by ts
-    cnt = len(bands)
-    if cnt == 0:
-        print('Empty data frame')
-        return stats
-    # I need to count Qs for every round operating hour
-    # verify round hour
-    start_date = bands.index[0].floor("h") #roundinig ts
-    end_date = bands.index[-1].ceil("h")
-    
-    #generate analysis interval list
-    if increment_unit not in ['minutes', 'hours']:
-        raise ValueError("Unit must be minute or hour")
-
-    increment = pd.Timedelta(**{increment_unit: increment})
-    intervals = list(zip(pd.date_range(start_date, end_date - increment, freq=increment), 
-                    pd.date_range(start_date + increment, end_date, freq=increment)))
-    
-    ts = bands.index
-    for s, e in intervals:
-        mask = ((s <= ts) & (ts < e))
-        cnt_total = int(mask.sum())
-        mult_total = (bands[mask].IsMultiplier1 | bands[mask].IsMultiplier2).sum()
-        sel = bands[mask]
-        stats[s] = (((sel.Band == 1.8).sum(), ((sel.Band == 1.8) & sel.IsRunQSO).sum()),
-                    ((sel.Band == 3.5).sum(), ((sel.Band == 3.5) & sel.IsRunQSO).sum()),
-                    ((sel.Band == 7.0).sum(), ((sel.Band == 7.0) & sel.IsRunQSO).sum()),
-                    ((sel.Band == 14.0).sum(), ((sel.Band == 14.0) & sel.IsRunQSO).sum()),
-                    ((sel.Band == 21.0).sum(), ((sel.Band == 21.0) & sel.IsRunQSO).sum()),
-                    ((sel.Band == 28.0).sum(), ((sel.Band == 28.0) & sel.IsRunQSO).sum()),
-                    mult_total,
-                    cnt_total, round(100.0*float(sel.IsRunQSO.sum())/(cnt_total + 0.001)),
-                    round(100.0*float(cnt_total)/cnt, 1))
-    
-    return stats
+    return performance_data(performance_frame(df, increment, increment_unit))
 
 def get_hours(ts : pd.Timestamp):
     return ts.strftime('%H%M')
 
+def format_duration(td : pd.Timedelta):
+    """ HH:MM, hours not wrapped at a day """
+    hours = td.components.days * 24 + td.components.hours
+    minutes = td.components.minutes
+    return f"{hours:02d}:{minutes:02d}"
+
+def flat_stats(stats):
+    """ Stats with plain str/number values for tables and files """
+    return {key: format_duration(val) if isinstance(val, pd.Timedelta) else
+                 (str(val) if isinstance(val, dict) else
+                  (val.item() if isinstance(val, np.generic) else val))
+            for key, val in stats.items()}
+
 def log(level, str):
     print(level, str)
\ No newline at end of file
@@ -0,0 +1,192 @@
+"""Timing spans, counters and profiles of the analysis pipeline.
+
+Instrumentation is off unless the LOGANALYZER_TRACE environment variable is
+set (to the trace file written at exit, 1 for trace.json) or enable() is
+called; a disabled span or counter costs one flag test. Spans of a user
+action (an operation: a click, a cli command) are summed into a breakdown,
+and all spans can be exported as a Chrome trace (chrome://tracing, Perfetto).
+With LOGANALYZER_PROFILE=N the last N operations are also run under cProfile."""
+import cProfile
+import functools
+import json
+import os
+import pstats
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+TRACE_ENV = 'LOGANALYZER_TRACE'
+PROFILE_ENV = 'LOGANALYZER_PROFILE'
+MAX_EVENTS = 200000 # oldest spans are dropped from the trace above this
+
+def env_trace_path():
+    value = os.environ.get(TRACE_ENV, '')
+    if value in ('', '0'):
+        return None
+    return 'trace.json' if value == '1' else value
+
+trace_path = env_trace_path()
+enabled = trace_path is not None
+_events = deque(maxlen=MAX_EVENTS) # (name, start ns, duration ns, pid, thread id, args)
+_counters = Counter()
+_operation = None # {'name', 'start', 'spans': Counter, 'counters': Counter, 'profile'}
+_operations = deque(maxlen=100) # finished operation breakdowns
+_profiles = deque(maxlen=int(os.environ.get(PROFILE_ENV, 0) or 0)) # (name, pstats.Stats)
+
+def enable(path: str = None, profile_last: int = 0):
+    """Start recording, path: trace file export_trace writes by default,
+    profile_last: number of last operations to keep cProfile stats of"""
+    global enabled, trace_path, _profiles
+    enabled = True
+    trace_path = path or trace_path
+    if profile_last:
+        _profiles = deque(_profiles, maxlen=profile_last)
+
+def record(name: str, start: int, duration: int, args: dict = None):
+    _events.append((name, start, duration, os.getpid(), threading.get_ident(), args))
+    if _operation is not None:
+        _operation['spans'][name] += duration
+
+@contextmanager
+def span(name: str, **args):
+    """Time the block as a span"""
+    if not enabled:
+        yield
+        return
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        record(name, start, time.perf_counter_ns() - start, args or None)
+
+def timed(name: str = None):
+    """Decorator timing each call of the function as a span named after it"""
+    def decorator(func):
+        span_name = name or func.__name__
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(span_name, start, time.perf_counter_ns() - start)
+        return wrapper
+    return decorator
+
+def count(name: str, n: int = 1):
+    """Add to a counter, e.g. rows loaded or cache hits"""
+    if not enabled:
+        return
+    _counters[name] += n
+    if _operation is not None:
+        _operation['counters'][name] += n
+
+def counters() -> dict:
+    return dict(_counters)
+
+def begin(name: str):
+    """Start an operation, ending the one still open"""
+    global _operation
+    if not enabled:
+        return
+    if _operation is not None:
+        end()
+    _operation = {'name': name, 'start': time.perf_counter_ns(), 'spans': Counter(), 'counters': Counter(),
+                  'profile': None}
+    if _profiles.maxlen:
+        _operation['profile'] = cProfile.Profile()
+        _operation['profile'].enable()
+
+def end() -> dict:
+    """Close the operation: {'name', 'total' ns, 'spans': {name: ns}, 'counters'}, None if none was open"""
+    global _operation
+    operation, _operation = _operation, None
+    if operation is None:
+        return None
+    total = time.perf_counter_ns() - operation['start']
+    record(operation['name'], operation['start'], total)
+    if operation['profile'] is not None:
+        operation['profile'].disable()
+        _profiles.append((operation['name'], pstats.Stats(operation['profile'])))
+    breakdown = {'name': operation['name'], 'total': total, 'spans': dict(operation['spans']),
+                 'counters': dict(operation['counters'])}
+    _operations.append(breakdown)
+    return breakdown
+
+@contextmanager
+def operation(name: str):
+    begin(name)
+    try:
+        yield
+    finally:
+        end()
+
+def last_operation() -> dict:
+    return _operations[-1] if _operations else None
+
+def format_breakdown(breakdown: dict, top: int = 6) -> str:
+    """'name 412 ms: read_sql 120 ms, generate_stats 80 ms | rows loaded 8000', spans are inclusive"""
+    if breakdown is None:
+        return ''
+    spans = sorted(breakdown['spans'].items(), key=lambda item: -item[1])[:top]
+    text = f"{breakdown['name']} {breakdown['total'] / 1e6:.0f} ms"
+    if spans:
+        text += ': ' + ', '.join(f'{name} {ns / 1e6:.0f} ms' for name, ns in spans)
+    if breakdown['counters']:
+        text += ' | ' + ', '.join(f'{name} {n}' for name, n in breakdown['counters'].items())
+    return text
+
+def drain() -> list:
+    """Remove and return the events recorded since the previous drain"""
+    events = []
+    while _events:
+        events.append(_events.popleft())
+    return events
+
+def traced_call(func, *args, **kwargs) -> tuple:
+    """Run func recording its spans, in a worker process: (result, events, counters) for merge.
+    The events are drained, each call sends only the ones recorded since the previous call"""
+    global enabled
+    was_enabled = enabled
+    enabled = True
+    counted = Counter(_counters)
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        enabled = was_enabled
+    return result, drain(), dict(Counter(_counters) - counted)
+
+def merge(events: list, counted: dict):
+    """Add spans and counters recorded by traced_call in another process"""
+    if not enabled:
+        return
+    for event in events:
+        _events.append(event)
+        if _operation is not None:
+            _operation['spans'][event[0]] += event[2]
+    for name, n in counted.items():
+        count(name, n)
+
+def export_trace(path: str = None) -> str:
+    """Write the spans and counters as Chrome trace event JSON, return the file written"""
+    path = path or trace_path or 'trace.json'
+    events = [{'name': name, 'ph': 'X', 'ts': start / 1000, 'dur': duration / 1000, 'pid': pid, 'tid': tid,
+               'args': args or {}} for name, start, duration, pid, tid, args in list(_events)]
+    if events:
+        events.append({'name': 'counters', 'ph': 'C', 'ts': max(e['ts'] + e['dur'] for e in events),
+                       'pid': os.getpid(), 'args': dict(_counters)})
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
+    return path
+
+def dump_profiles(directory: str = '.') -> list:
+    """Write cProfile stats of the last operations as .prof files (pstats, snakeviz), return their paths"""
+    paths = []
+    for i, (name, stats) in enumerate(_profiles):
+        path = os.path.join(directory, f"profile_{i}_{name.replace(' ', '_')}.prof")
+        stats.dump_stats(path)
+        paths.append(path)
+    return paths
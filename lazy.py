@@ -0,0 +1,19 @@
+"""Modules imported on first use, to keep pandas out of the app's startup."""
+import importlib.util
+import sys
+
+def lazy_import(name: str):
+    """Module that is executed on its first attribute access (importlib LazyLoader).
+    Later imports of the module, e.g. by the module's own importers, get the same object."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f'No module named {name!r}', name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,132 @@
+"""Unique entities (multipliers) of DXLOG frames on dictionary encoded columns.
+
+Labels of each entity column are encoded once into integer codes shared by
+all chunks, so an update is a few bincount/minimum.at passes over int arrays
+whatever the labels, cheap enough for every live refresh."""
+import numpy as np
+import pandas as pd
+
+# entity kind: DXLOG column
+MULT_COLUMNS = {'Continents': 'Continent', 'Countries': 'CountryPrefix', 'Sections': 'Sect'}
+NOT_WORKED = np.iinfo(np.int64).max # first worked time of entities not worked
+HOUR = pd.Timedelta(hours=1).value
+
+def encode(dictionary: dict, series: pd.Series) -> np.ndarray:
+    """ Codes of the values in dictionary {label: code}, adding new labels; blank values are -1 """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, labels = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, labels = pd.factorize(series)
+    lookup = np.array([dictionary.setdefault(label, len(dictionary)) if str(label).strip() != '' else -1
+                       for label in labels] + [-1], dtype=np.int64)
+    return lookup[codes] # code -1 (missing) picks the trailing -1
+
+def grow(first, shape):
+    """ first enlarged to shape, new cells not worked """
+    if first.shape == shape:
+        return first
+    grown = np.full(shape, NOT_WORKED, dtype=np.int64)
+    grown[tuple(slice(0, n) for n in first.shape)] = first
+    return grown
+
+class MultAccumulator:
+    """ Entities worked in DXLOG chunks fed in time order: when each was first
+        worked overall, per band and per radio, plus QSOs per band and radio."""
+    def __init__(self, columns=MULT_COLUMNS):
+        self.columns_ = dict(columns)
+        self.labels_ = {kind: {} for kind in self.columns_} # label: code
+        self.bands_ = {} # band: code
+        self.radios_ = {}
+        # first worked ns per (band, radio, entity code), the last entity column collects blanks
+        self.first_ = {kind: np.zeros((0, 0, 1), dtype=np.int64) for kind in self.columns_}
+        self.qsos_ = np.zeros((0, 0), dtype=np.int64) # per (band, radio)
+        self.start_ = None # ns of the first and last QSO
+        self.last_ = None
+
+    def update(self, df, ts=None):
+        """ Add a chunk of QSOs, ts: its int64 ns timestamps when already at hand """
+        if len(df) == 0:
+            return
+        if ts is None:
+            ts = np.asarray(df.index, dtype='datetime64[ns]').view(np.int64)
+        if self.start_ is None:
+            self.start_ = int(ts[0])
+        self.last_ = int(ts[-1])
+        # frames without bands (stats columns only) count as one band 0
+        bands = encode(self.bands_, df.Band.fillna(0) if 'Band' in df.columns else pd.Series(0.0, index=df.index))
+        radios = encode(self.radios_, df.RadioNR)
+        shape = (len(self.bands_), len(self.radios_))
+        cells = bands * shape[1] + radios
+        self.qsos_ = np.bincount(cells, minlength=shape[0] * shape[1]).reshape(shape) + \
+                     np.pad(self.qsos_, [(0, n - m) for n, m in zip(shape, self.qsos_.shape)])
+        for kind, column in self.columns_.items():
+            codes = encode(self.labels_[kind], df[column])
+            size = len(self.labels_[kind])
+            codes[codes < 0] = size # blank column
+            first = self.first_[kind] = grow(self.first_[kind], shape + (size + 1,))
+            # unbuffered minimum: earliest time per cell without sorting the chunk
+            np.minimum.at(first.reshape(-1), cells * (size + 1) + codes, ts)
+
+    def worked(self, kind, axis):
+        """ First worked ns of the entity codes, over band and radio (axis None), per band (0) or per radio (1) """
+        first = self.first_[kind][:, :, :-1]
+        if self.start_ is None:
+            return np.zeros((0, 0) if axis is not None else 0, dtype=np.int64)
+        if axis is None:
+            return first.min(axis=(0, 1))
+        return first.min(axis=1 - axis)
+
+    def first(self, kind):
+        """ int64 ns each entity code was first worked, NOT_WORKED if not """
+        return self.worked(kind, None)
+
+    def counts(self):
+        """ {kind: number of entities worked} """
+        return {kind: int((self.first(kind) != NOT_WORKED).sum()) for kind in self.columns_}
+
+    def first_worked(self, kind):
+        """ Series of the time each entity was first worked, in time order """
+        first = self.first(kind)
+        labels = np.array(list(self.labels_[kind]), dtype=object)
+        worked = first != NOT_WORKED
+        order = np.argsort(first[worked], kind='stable')
+        return pd.Series(pd.to_datetime(first[worked][order]), index=labels[worked][order], name=kind)
+
+    def timeline(self, bucket=pd.Timedelta(hours=1)):
+        """ DataFrame indexed by hours since the round hour of the first QSO with new
+            and cumulative entities per bucket, for every kind"""
+        if self.start_ is None:
+            return pd.DataFrame()
+        width = pd.Timedelta(bucket).value
+        origin = self.start_ - self.start_ % HOUR
+        slots = {kind: (first[first != NOT_WORKED] - origin) // width
+                 for kind, first in ((kind, self.first(kind)) for kind in self.columns_)}
+        size = int((self.last_ - origin) // width) + 1
+        columns = {}
+        for kind, s in slots.items():
+            new = np.bincount(s, minlength=size)
+            columns[f'New {kind}'] = new
+            columns[kind] = new.cumsum()
+        return pd.DataFrame(columns, index=pd.Index(np.arange(size) * (width / HOUR), name='Hour'))
+
+    def breakdown(self, by='band'):
+        """ DataFrame of QSOs and entities worked per band or per radio """
+        axis = 0 if by == 'band' else 1
+        keys = self.bands_ if by == 'band' else self.radios_
+        frame = pd.DataFrame({'QSOs': self.qsos_.sum(axis=1 - axis)}, index=pd.Index(list(keys), name=by.capitalize()))
+        for kind in self.columns_:
+            frame[kind] = (self.worked(kind, axis) != NOT_WORKED).sum(axis=1)
+        return frame.sort_index()
+
+    def result(self):
+        """ Everything generate_mults returns """
+        return {'counts': self.counts(), 'timeline': self.timeline(),
+                'first worked': {kind: self.first_worked(kind) for kind in self.columns_},
+                'per band': self.breakdown('band'), 'per radio': self.breakdown('radio')}
+
+def generate_mults(df):
+    """ Entity counts, first worked times, new entities per hour and per band/radio breakdowns
+        of a DXLOG frame, see MultAccumulator.result"""
+    accumulator = MultAccumulator()
+    accumulator.update(df.sort_index())
+    return accumulator.result()
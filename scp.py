@@ -0,0 +1,161 @@
+"""Super check partial (MASTER.SCP) call index, dupe and busted call checks."""
+import os
+import numpy as np
+import pandas as pd
+import instrument
+
+CHECK_COLUMNS = ['Call', 'Band', 'Mode'] # DXLOG columns check_qsos needs besides TS
+ISSUES = ['Dupe', 'Busted?', 'Not in SCP']
+
+def read_scp(path: str) -> list:
+    """Calls of a super check partial file, # lines are comments"""
+    with open(path, encoding='latin-1') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+def base_call(call: str) -> str:
+    """Call without portable prefixes and suffixes, the longest part between slashes"""
+    return max(call.split('/'), key=len) if '/' in call else call
+
+def deletions(calls: np.ndarray) -> tuple:
+    """Every call of a str array with one character deleted
+        return: (variants, index of their call, deleted position, characters of the calls as uint32 rows)"""
+    width = max(calls.dtype.itemsize // 4, 1)
+    chars = np.ascontiguousarray(calls.astype(f'U{width}')).view(np.uint32).reshape(-1, width)
+    lengths = np.char.str_len(calls)
+    variants, owners, positions = [], [], []
+    for i in range(width):
+        rows = np.flatnonzero(lengths > i)
+        variants.append(np.concatenate([chars[rows, :i], chars[rows, i + 1:],
+                                        np.zeros((len(rows), 1), dtype=np.uint32)], axis=1))
+        owners.append(rows)
+        positions.append(np.full(len(rows), i))
+    variants = np.ascontiguousarray(np.concatenate(variants)).view(f'U{width}').reshape(-1)
+    return variants, np.concatenate(owners), np.concatenate(positions), chars
+
+def matches(sorted_array: np.ndarray, queries: np.ndarray) -> tuple:
+    """(positions in sorted_array, query index) of every element equal to a query"""
+    lo = np.searchsorted(sorted_array, queries, side='left')
+    counts = np.searchsorted(sorted_array, queries, side='right') - lo
+    positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lo, counts)
+    return positions, np.repeat(np.arange(len(queries)), counts)
+
+class SCPIndex:
+    """Known calls in sorted arrays.
+
+    calls_ is searched by bisection for exact and prefix lookups. deletes_
+    holds every call with one character deleted, sorted, with the call and
+    position it came from, so calls one edit apart are found by bisection
+    too (symmetric delete): an extra character is deleted from the call to
+    meet calls_, a missing one meets deletes_, and substituted or swapped
+    characters meet in deletes_ from both sides at the same or next position."""
+    def __init__(self, calls):
+        self.calls_ = np.unique(np.array([c.strip().upper() for c in calls if c.strip()], dtype=str))
+        deletes, owners, positions, self.chars_ = deletions(self.calls_)
+        order = np.argsort(deletes, kind='stable')
+        self.deletes_ = deletes[order]
+        self.delete_owners_ = owners[order]
+        self.delete_positions_ = positions[order]
+
+    def __len__(self):
+        return len(self.calls_)
+
+    def __contains__(self, call: str) -> bool:
+        i = np.searchsorted(self.calls_, call)
+        return i < len(self.calls_) and self.calls_[i] == call
+
+    def contains(self, calls: np.ndarray) -> np.ndarray:
+        """Vectorized membership of an array of calls"""
+        calls = np.asarray(calls, dtype=str)
+        if len(self.calls_) == 0:
+            return np.zeros(len(calls), dtype=bool)
+        i = np.minimum(np.searchsorted(self.calls_, calls), len(self.calls_) - 1)
+        return self.calls_[i] == calls
+
+    def starting_with(self, prefix: str) -> np.ndarray:
+        lo, hi = np.searchsorted(self.calls_, [prefix, prefix + '\uffff'])
+        return self.calls_[lo:hi]
+
+    def partial(self, fragment: str) -> np.ndarray:
+        """Calls containing the fragment anywhere, as super check partial shows them"""
+        return self.calls_[np.char.find(self.calls_, fragment.upper()) >= 0]
+
+    def near(self, call: str) -> list:
+        """Known calls within one edit (insert, delete, substitute, adjacent swap) of call"""
+        return self.near_calls([call])[0]
+
+    def near_calls(self, calls) -> list:
+        """near() of each call, bisecting the deletes of all calls at once"""
+        calls = np.array([call.upper() for call in calls], dtype=str).reshape(-1)
+        variants, owners, positions, chars = deletions(calls)
+        # variant is a known call: the call has an extra character
+        known = self.contains(variants)
+        owner = [owners[known]]
+        candidate = [np.searchsorted(self.calls_, variants[known])]
+        # call is a known call with a character deleted: the call misses one
+        found, query = matches(self.deletes_, calls)
+        owner.append(query)
+        candidate.append(self.delete_owners_[found])
+        # variant meets a known call with a character deleted: substituted at the same position,
+        # swapped with the next one when the character the call lost is the one the known call lost
+        found, query = matches(self.deletes_, variants)
+        n, i, j, c = owners[query], positions[query], self.delete_positions_[found], self.delete_owners_[found]
+        edit = (i == j) | ((j == i + 1) & (chars[n, i] == self.chars_[c, np.minimum(j, self.chars_.shape[1] - 1)]))
+        owner.append(n[edit])
+        candidate.append(c[edit])
+        owner, candidate = np.concatenate(owner), np.concatenate(candidate)
+        other = self.calls_[candidate] != calls[owner]
+        keys = np.unique(owner[other] * len(self.calls_) + candidate[other])
+        bounds = np.searchsorted(keys // max(len(self.calls_), 1), np.arange(len(calls) + 1))
+        near = self.calls_[keys % max(len(self.calls_), 1)].tolist()
+        return [near[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+_indexes = {} # path: (modification time, SCPIndex), kept by worker processes between requests
+
+def file_version(path: str):
+    """(absolute path, modification time) the checks against the file depend on, None when it can't be read"""
+    try:
+        return os.path.abspath(path), os.path.getmtime(path)
+    except (OSError, TypeError):
+        return None
+
+@instrument.timed()
+def load_index(path: str):
+    """SCPIndex of the file, built again only when the file changed, None when it can't be read"""
+    try:
+        mtime = os.path.getmtime(path)
+        cached = _indexes.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = _indexes[path] = (mtime, SCPIndex(read_scp(path)))
+        return cached[1]
+    except OSError:
+        return None
+
+def find_dupes(df: pd.DataFrame) -> np.ndarray:
+    """QSOs repeating an earlier call/band/mode, by hashing"""
+    keys = pd.DataFrame({'Call': df.Call.fillna('').astype(str).str.strip().str.upper(),
+                         'Band': df.Band, 'Mode': df.Mode})
+    return keys.duplicated(keep='first').to_numpy()
+
+@instrument.timed()
+def check_qsos(df: pd.DataFrame, index: SCPIndex = None) -> pd.DataFrame:
+    """ Dupes and calls not in the SCP index of a DXLOG frame, in time order
+        return: DataFrame indexed by TS with Call, Band, Mode, Issue (ISSUES) and
+                Suggestions (known calls one edit away) columns, only QSOs with an issue"""
+    df = df.sort_index()
+    calls = df.Call.fillna('').astype(str).str.strip().str.upper()
+    issue = np.where(find_dupes(df), 'Dupe', '').astype(object)
+    suggestions = np.full(len(df), '', dtype=object)
+    if index is not None and len(df):
+        unique, inverse = np.unique(calls.map(base_call).to_numpy(dtype=str), return_inverse=True)
+        unknown = np.flatnonzero(~index.contains(unique))
+        near = np.full(len(unique), '', dtype=object)
+        near[unknown] = [' '.join(known) for known in index.near_calls(unique[unknown].tolist())]
+        missing = np.zeros(len(unique), dtype=bool)
+        missing[unknown] = True
+        flagged = missing[inverse] & (issue == '') & (calls.to_numpy() != '')
+        issue[flagged] = np.where(near[inverse][flagged] != '', 'Busted?', 'Not in SCP')
+        suggestions = near[inverse]
+    keep = issue != ''
+    return pd.DataFrame({'Call': calls.to_numpy()[keep], 'Band': df.Band.to_numpy()[keep],
+                         'Mode': df.Mode.to_numpy()[keep], 'Issue': issue[keep],
+                         'Suggestions': suggestions[keep]}, index=df.index[keep])
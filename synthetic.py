@@ -0,0 +1,151 @@
+"""Synthetic N1MM+ database generator used by the benchmarks."""
+import argparse
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+
+DXLOG_SCHEMA = """CREATE TABLE DXLOG (
+    ContestName TEXT, ContestNR INTEGER, TS TEXT, Call TEXT, Band REAL, Freq REAL, QSXFreq REAL,
+    Mode TEXT, Snt TEXT, Rcv TEXT, SntNr INTEGER, RcvNr INTEGER, GridSquare TEXT, Exchange1 TEXT,
+    Sect TEXT, Name TEXT, Power TEXT, CountryPrefix TEXT, WPXPrefix TEXT, Continent TEXT, Zone INTEGER,
+    Points INTEGER, IsMultiplier1 INTEGER, IsMultiplier2 INTEGER, IsMultiplier3 INTEGER, IsRunQSO INTEGER,
+    RadioNR INTEGER, Operator TEXT, StationPrefix TEXT, QTH TEXT, RoverLocation TEXT,
+    RadioInterfaced INTEGER, NetworkedCompNr INTEGER, ID TEXT, ContactType TEXT, Comment TEXT,
+    NetBiosName TEXT, IsOriginal INTEGER, CLAIMEDQSO INTEGER)"""
+
+CONTEST_SCHEMA = """CREATE TABLE ContestInstance (
+    ContestID INTEGER, ContestName TEXT, ContestNR INTEGER, StartDate TEXT, Operator TEXT,
+    AssistedCategory TEXT, BandCategory TEXT, ModeCategory TEXT, OperatorCategory TEXT,
+    PowerCategory TEXT, StationCategory TEXT, TransmitterCategory TEXT, Soapbox TEXT)"""
+
+BANDS = np.array([1.8, 3.5, 7.0, 14.0, 21.0, 28.0])
+DEFAULT_BAND_MIX = (0.05, 0.1, 0.25, 0.3, 0.2, 0.1)
+CONTINENTS = np.array(['NA', 'EU', 'AS', 'SA', 'OC', 'AF', ''])
+SECTIONS = np.array(['SCV', 'SV', 'EB', 'SF', 'LAX', 'ORG', 'SDG', 'SB', 'PAC', 'AZ',
+                     'NM', 'WWA', 'EWA', 'OR', 'ID', 'MT', 'UT', 'NV', 'CO', 'WY', ''])
+
+
+def make_calls(count, rng):
+    """Random but plausible callsigns"""
+    letters = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+    prefixes = np.array(['K', 'W', 'N', 'AA', 'KB', 'VE', 'JA', 'DL', 'G', 'F', 'I', 'EA',
+                         'OH', 'SM', 'UA', 'LU', 'PY', 'VK', 'ZL', 'ZS'])
+    pre = rng.choice(prefixes, count)
+    digit = rng.integers(0, 10, count).astype(str)
+    suffix_len = rng.integers(1, 4, count)
+    suffix = [''.join(rng.choice(letters, n)) for n in suffix_len]
+    return np.char.add(np.char.add(pre, digit), np.array(suffix))
+
+
+def generate_contest_qsos(contest_nr, qsos, start, duration_hours=48, band_mix=DEFAULT_BAND_MIX,
+                          run_ratio=0.6, radios=1, breaks=3, break_minutes=(35, 240), seed=None,
+                          contest_name='CQWWCW'):
+    """ Generate DXLOG rows for a single contest
+        return: DataFrame with DXLOG schema sorted by TS"""
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp(start)
+    span = duration_hours * 3600
+    # carve off-time breaks out of the contest period and spread QSOs over the rest
+    offs = np.sort(rng.uniform(0, span, breaks))
+    lengths = rng.uniform(break_minutes[0] * 60, break_minutes[1] * 60, breaks)
+    on_span = span - lengths.sum()
+    secs = np.sort(rng.uniform(0, max(on_span, 60), qsos))
+    for off, length in zip(offs, lengths):
+        secs[secs >= off] += length
+    secs = np.minimum(secs.astype(np.int64), span - 1)
+    ts = (start + pd.to_timedelta(secs, unit='s')).strftime('%Y-%m-%d %H:%M:%S')
+    band_mix = np.asarray(band_mix, dtype=float)
+    band = rng.choice(BANDS, qsos, p=band_mix / band_mix.sum())
+    calls = make_calls(qsos, rng)
+    is_run = (rng.random(qsos) < run_ratio).astype(int)
+    continent = rng.choice(CONTINENTS, qsos, p=[0.5, 0.25, 0.1, 0.05, 0.04, 0.03, 0.03])
+    country = np.char.add(np.array([c[:2] for c in calls]), '')
+    sect = rng.choice(SECTIONS, qsos)
+    mult1 = (rng.random(qsos) < 0.08).astype(int)
+    mult2 = (rng.random(qsos) < 0.04).astype(int)
+    df = pd.DataFrame({
+        'ContestName': contest_name, 'ContestNR': contest_nr, 'TS': ts, 'Call': calls, 'Band': band,
+        'Freq': band * 1000 + rng.uniform(0, 100, qsos).round(1), 'QSXFreq': 0.0,
+        'Mode': 'CW', 'Snt': '599', 'Rcv': '599', 'SntNr': np.arange(1, qsos + 1), 'RcvNr': 0,
+        'GridSquare': '', 'Exchange1': '', 'Sect': sect, 'Name': '', 'Power': '',
+        'CountryPrefix': country, 'WPXPrefix': country, 'Continent': continent,
+        'Zone': rng.integers(1, 41, qsos), 'Points': rng.integers(1, 4, qsos),
+        'IsMultiplier1': mult1, 'IsMultiplier2': mult2, 'IsMultiplier3': 0, 'IsRunQSO': is_run,
+        'RadioNR': rng.integers(1, radios + 1, qsos), 'Operator': '', 'StationPrefix': '', 'QTH': '',
+        'RoverLocation': '', 'RadioInterfaced': 1, 'NetworkedCompNr': 0,
+        'ID': [f'{contest_nr:04d}{i:08d}' for i in range(qsos)], 'ContactType': '', 'Comment': '',
+        'NetBiosName': 'SHACK', 'IsOriginal': 1, 'CLAIMEDQSO': 1})
+    return df
+
+
+def write_database(path, contests=3, qsos=5000, seed=0, **kwargs):
+    """ Write an N1MM-schema SQLite database with synthetic contests
+        return: path of the created file"""
+    if os.path.exists(path):
+        os.remove(path)
+    rng = np.random.default_rng(seed)
+    with sqlite3.connect(path) as con:
+        con.execute(DXLOG_SCHEMA)
+        con.execute(CONTEST_SCHEMA)
+        names = ['CQWWCW', 'ARRLDXCW', 'CQWPXSSB', 'NAQPCW', 'ARRLSS', 'ARRL10M']
+        for nr in range(1, contests + 1):
+            name = names[(nr - 1) % len(names)]
+            start = pd.Timestamp('2015-01-01') + pd.Timedelta(days=int(rng.integers(0, 3650)))
+            start = start.floor('D')
+            count = int(qsos) if np.isscalar(qsos) else int(qsos[nr - 1])
+            df = generate_contest_qsos(nr, count, start, seed=int(rng.integers(1 << 31)),
+                                       contest_name=name, **kwargs)
+            df.to_sql('DXLOG', con, if_exists='append', index=False)
+            con.execute('INSERT INTO ContestInstance VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)',
+                        (nr, name, nr, start.strftime('%Y-%m-%d %H:%M:%S'), 'N0CALL', 'NON-ASSISTED',
+                         'ALL', 'CW', 'SINGLE-OP', 'HIGH', 'FIXED', 'ONE', ''))
+    return path
+
+
+CABRILLO_MODES = {'CW': 'CW', 'SSB': 'PH', 'RTTY': 'RY'}
+
+def write_cabrillo(path, qsos=2000, seed=0, callsign='N0CALL', contest_name='CQ-WW-CW', **kwargs):
+    """ Write a synthetic Cabrillo 3.0 log, exchange RST and zone
+        return: path of the created file"""
+    df = generate_contest_qsos(1, qsos, '2020-11-28', seed=seed, **kwargs)
+    ts = pd.to_datetime(df.TS)
+    radios = kwargs.get('radios', 1)
+    lines = [f"QSO: {freq:5.0f} {CABRILLO_MODES.get(mode, mode)} {t:%Y-%m-%d %H%M} {callsign:13s} 599 {5:<3d} "
+             f"{call:13s} 599 {zone:<3d}" + (f" {radio - 1}" if radios > 1 else '')
+             for freq, mode, t, call, zone, radio in zip(df.Freq, df.Mode, ts, df.Call, df.Zone, df.RadioNR)]
+    with open(path, 'w') as f:
+        f.write('START-OF-LOG: 3.0\n')
+        f.write(f'CONTEST: {contest_name}\nCALLSIGN: {callsign}\nCATEGORY-OPERATOR: SINGLE-OP\n')
+        f.write('CATEGORY-POWER: HIGH\nCATEGORY-TRANSMITTER: ' + ('TWO' if radios > 1 else 'ONE') + '\n')
+        f.write(f'OPERATORS: {callsign}\n')
+        f.write('\n'.join(lines))
+        f.write('\nEND-OF-LOG:\n')
+    return path
+
+
+def write_scp(path, calls=(), count=40000, seed=0):
+    """ Write a super check partial file of the calls and random ones, count calls in all
+        return: path of the created file"""
+    rng = np.random.default_rng(seed)
+    known = list(dict.fromkeys(calls))[:count]
+    known += list(dict.fromkeys(make_calls(2 * count, rng)))[:count - len(known)]
+    with open(path, 'w') as f:
+        f.write('# synthetic super check partial\n')
+        f.write('\n'.join(sorted(known)))
+        f.write('\n')
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a synthetic N1MM+ database')
+    parser.add_argument('path')
+    parser.add_argument('--contests', type=int, default=3)
+    parser.add_argument('--qsos', type=int, default=5000)
+    parser.add_argument('--radios', type=int, default=1)
+    parser.add_argument('--run-ratio', type=float, default=0.6)
+    parser.add_argument('--breaks', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_database(args.path, contests=args.contests, qsos=args.qsos, seed=args.seed,
+                   radios=args.radios, run_ratio=args.run_ratio, breaks=args.breaks)